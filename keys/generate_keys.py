@@ -0,0 +1,60 @@
+"""
+Генерация пары ключей для подписи JWT.
+
+    python keys/generate_keys.py --algorithm EdDSA  # ed25519_{private,public}.pem
+    python keys/generate_keys.py --algorithm ES256  # es256_{private,public}.pem
+    python keys/generate_keys.py --algorithm RS256  # {private,public}.pem
+
+Приватный ключ нужен только Auth Service, публичный - Auth и Orders.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+FILE_PREFIXES = {"RS256": "", "ES256": "es256_", "EdDSA": "ed25519_"}
+
+
+def generate_private_key(algorithm: str):
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate JWT signing key pair")
+    parser.add_argument("--algorithm", choices=list(FILE_PREFIXES), default="EdDSA")
+    parser.add_argument("--out", default=str(Path(__file__).parent))
+    parser.add_argument("--force", action="store_true", help="Overwrite existing")
+    args = parser.parse_args()
+
+    prefix = FILE_PREFIXES[args.algorithm]
+    private_path = Path(args.out) / f"{prefix}private.pem"
+    public_path = Path(args.out) / f"{prefix}public.pem"
+    if not args.force and (private_path.exists() or public_path.exists()):
+        sys.exit(f"{private_path} or {public_path} already exists, use --force")
+
+    private_key = generate_private_key(args.algorithm)
+    private_path.write_bytes(
+        private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+    )
+    public_path.write_bytes(
+        private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    print(f"{args.algorithm}: {private_path}, {public_path}")
+
+
+if __name__ == "__main__":
+    main()
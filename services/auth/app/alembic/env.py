@@ -45,9 +45,10 @@ def run_migrations_offline() -> None:
 
 
 def run_migrations_online() -> None:
-    from app.database import engine
+    from sqlalchemy import create_engine
 
-    connectable = engine
+    # Приложение работает через asyncpg, миграции - через синхронный psycopg2
+    connectable = create_engine(app_settings.postgres_auth_url)
 
     with connectable.connect() as connection:
         context.configure(connection=connection, target_metadata=target_metadata)
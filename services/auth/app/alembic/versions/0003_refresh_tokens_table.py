@@ -0,0 +1,73 @@
+"""
+Revision ID: 0003_refresh_tokens_table
+Revises: 0002_add_refresh_tokens
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0003_refresh_tokens_table"
+down_revision = "0002_add_refresh_tokens"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "refresh_tokens",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("token_hash", sa.String(64), nullable=False),
+        sa.Column("session_id", sa.String(32), nullable=False),
+        sa.Column("user_agent", sa.String(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("revoked_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index(
+        op.f("ix_refresh_tokens_token_hash"),
+        "refresh_tokens",
+        ["token_hash"],
+        unique=True,
+    )
+    op.create_index(
+        op.f("ix_refresh_tokens_user_id"), "refresh_tokens", ["user_id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_refresh_tokens_session_id"),
+        "refresh_tokens",
+        ["session_id"],
+        unique=False,
+    )
+
+    # Переносим действующие токены, чтобы пользователей не разлогинило
+    op.execute("""
+        INSERT INTO refresh_tokens (user_id, token_hash, session_id, expires_at)
+        SELECT id,
+               encode(sha256(convert_to(refresh_token, 'UTF8')), 'hex'),
+               md5(random()::text || id::text),
+               now() + interval '7 days'
+        FROM users
+        WHERE refresh_token IS NOT NULL
+    """)
+    op.drop_column("users", "refresh_token")
+
+
+def downgrade():
+    # Открытые значения токенов не восстановить: пользователи войдут заново
+    op.add_column("users", sa.Column("refresh_token", sa.String(), nullable=True))
+    op.drop_index(op.f("ix_refresh_tokens_session_id"), table_name="refresh_tokens")
+    op.drop_index(op.f("ix_refresh_tokens_user_id"), table_name="refresh_tokens")
+    op.drop_index(op.f("ix_refresh_tokens_token_hash"), table_name="refresh_tokens")
+    op.drop_table("refresh_tokens")
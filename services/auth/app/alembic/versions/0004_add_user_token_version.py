@@ -0,0 +1,26 @@
+"""
+Revision ID: 0004_add_user_token_version
+Revises: 0003_refresh_tokens_table
+Create Date: 2026-10-19 00:00:00.000000
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004_add_user_token_version"
+down_revision = "0003_refresh_tokens_table"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "users",
+        sa.Column(
+            "token_version", sa.Integer(), nullable=False, server_default=sa.text("0")
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("users", "token_version")
@@ -0,0 +1,5 @@
+import redis.asyncio as redis
+
+from .config import settings
+
+redis_client = redis.Redis.from_url(settings.redis_url, decode_responses=True)
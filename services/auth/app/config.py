@@ -1,8 +1,12 @@
 import os
 from pathlib import Path
+from typing import Literal
 
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
+SUPPORTED_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+
 
 class Settings(BaseSettings):
     postgres_auth_host: str = "postgres_auth"
@@ -15,17 +19,71 @@ class Settings(BaseSettings):
     def __str__(self):
         return f"Settings(postgres_auth_url={self.postgres_auth_url})"
 
+    # Алгоритм подписи access token: RS256, ES256 (P-256) или EdDSA (Ed25519)
     algorithm: str = "RS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
 
-    # Пути к RSA ключам
+    # Пути к ключам подписи (тип ключа должен соответствовать algorithm)
     private_key_path: str = "/app/keys/private.pem"
     public_key_path: str = "/app/keys/public.pem"
+    # Ротация ключа или смена алгоритма: токены, подписанные прежним ключом,
+    # принимаются до истечения их срока жизни (ключи различаются по kid).
+    # Пусто - проверяется только текущий ключ. Алгоритм прежнего ключа
+    # определяется по типу ключа; previous_algorithm - необязательная сверка
+    previous_algorithm: str = ""
+    previous_public_key_path: str = ""
+
+    # Redis: кеш состояния пользователей для проверки access token без БД
+    redis_url: str = "redis://redis:6379/3"
+    # Сколько живёт запись о пользователе в Redis и в памяти процесса (сек).
+    # Локальный TTL ограничивает задержку вступления отзыва в силу
+    user_state_cache_ttl_seconds: int = 300
+    user_state_local_ttl_seconds: int = 5
+    # Сколько пользователей держать в памяти процесса (LRU)
+    user_state_local_max_entries: int = 10000
+
+    # Параметры argon2 (по умолчанию - рекомендация OWASP: 19 MiB, 2 прохода)
+    argon2_time_cost: int = 2
+    argon2_memory_cost: int = 19456
+    argon2_parallelism: int = 1
+    # Пул процессов для хеширования: 0 - по числу CPU
+    password_hash_workers: int = 0
+    # Сколько хеширований может ждать в очереди, дальше - 503
+    password_hash_max_pending: int = 64
+    password_hash_retry_after_seconds: int = 1
 
     google_client_id: str = ""
     google_client_secret: str = ""
     google_redirect_uri: str = "http://localhost:8001/auth/callback/google"
+    # Эндпоинты Google (переопределяются для локального mock-сервера)
+    google_token_url: str = "https://oauth2.googleapis.com/token"
+    google_userinfo_url: str = "https://www.googleapis.com/oauth2/v3/userinfo"
+    google_certs_url: str = "https://www.googleapis.com/oauth2/v3/certs"
+    google_issuers: str = "accounts.google.com,https://accounts.google.com"
+    # Общий HTTP-клиент к Google: таймаут и лимиты keep-alive соединений
+    google_http_timeout_seconds: float = 5.0
+    google_http_max_connections: int = 20
+    google_http_max_keepalive_connections: int = 10
+    # Сколько кешировать ключи Google, если в ответе нет Cache-Control max-age
+    google_certs_default_ttl_seconds: int = 3600
+    # Минимальный интервал между обновлениями JWKS из-за неизвестного kid
+    google_certs_min_refresh_interval_seconds: int = 30
+
+    # Профилирование запросов: по заголовку X-Profile с этим токеном (пусто -
+    # выключено) и/или случайная доля запросов. Движок: pyinstrument или cprofile
+    profiling_token: str = ""
+    profiling_header: str = "X-Profile"
+    profiling_sample_rate: float = 0.0
+    profiling_engine: Literal["pyinstrument", "cprofile"] = "pyinstrument"
+    profiling_dir: str = "/tmp/profiles"
+    server_timing_enabled: bool = True
+
+    # Инструментирование SQL: порог медленного оператора, число повторов одного
+    # отпечатка за HTTP-запрос для предупреждения (0 - выключено), размер реестра
+    sql_slow_query_ms: float = 200
+    sql_repeated_query_threshold: int = 5
+    sql_stats_max_queries: int = 500
 
     @property
     def postgres_auth_url(self) -> str:
@@ -37,6 +95,13 @@ class Settings(BaseSettings):
         db = os.getenv("POSTGRES_AUTH_DB", self.postgres_auth_db)
         return f"postgresql://{user}:{password}@{host}:{port}/{db}"
 
+    @property
+    def postgres_auth_async_url(self) -> str:
+        # Тот же URL, но с async-драйвером asyncpg
+        return self.postgres_auth_url.replace(
+            "postgresql://", "postgresql+asyncpg://", 1
+        )
+
     @property
     def private_key(self) -> str:
         # Читаем приватный ключ из файла
@@ -63,15 +128,40 @@ class Settings(BaseSettings):
             return self._generate_fallback_public_key()
         return key_path.read_text()
 
+    @property
+    def previous_public_key(self) -> str | None:
+        if not self.previous_public_key_path:
+            return None
+        # Указанный, но отсутствующий файл - ошибка конфигурации: FileNotFoundError
+        return Path(self.previous_public_key_path).read_text()
+
+    @field_validator("algorithm", "previous_algorithm")
+    @classmethod
+    def check_algorithm(cls, value: str) -> str:
+        if value and value not in SUPPORTED_ALGORITHMS:
+            raise ValueError(
+                f"Unsupported JWT algorithm {value!r}, "
+                f"expected one of {', '.join(SUPPORTED_ALGORITHMS)}"
+            )
+        return value
+
+    def _generate_private_key_object(self):
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+        if self.algorithm == "EdDSA":
+            return ed25519.Ed25519PrivateKey.generate()
+        if self.algorithm == "ES256":
+            return ec.generate_private_key(ec.SECP256R1())
+        return rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=2048,
+        )
+
     def _generate_fallback_private_key(self) -> str:
         """Генерирует тестовый приватный ключ для разработки"""
         from cryptography.hazmat.primitives import serialization
-        from cryptography.hazmat.primitives.asymmetric import rsa
 
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-        )
+        private_key = self._generate_private_key_object()
         return private_key.private_bytes(
             encoding=serialization.Encoding.PEM,
             format=serialization.PrivateFormat.PKCS8,
@@ -81,12 +171,8 @@ class Settings(BaseSettings):
     def _generate_fallback_public_key(self) -> str:
         """Генерирует тестовый публичный ключ для разработки"""
         from cryptography.hazmat.primitives import serialization
-        from cryptography.hazmat.primitives.asymmetric import rsa
 
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-        )
+        private_key = self._generate_private_key_object()
         public_key = private_key.public_key()
         return public_key.public_bytes(
             encoding=serialization.Encoding.PEM,
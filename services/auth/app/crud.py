@@ -1,51 +1,68 @@
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models, schemas
+from .config import settings
 from .security import get_encryption_manager
-
-# Use argon2 as primary (no 72-byte limit) with bcrypt as fallback
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+from .user_state import MISSING_USER, UserState, store_user_state
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.User).where(models.User.email == email))
 
 
-def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
 
 
-def create_user(db: Session, user: schemas.UserCreate):
-    password = user.password
-    if len(password.encode("utf-8")) > 72:
-        password = password[:72]
-    hashed_password = pwd_context.hash(password)
-    db_user = models.User(email=user.email, hashed_password=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+async def create_user(
+    db: AsyncSession,
+    user: schemas.UserCreate,
+    hashed_password: str,
+):
+    """
+    INSERT ... ON CONFLICT DO NOTHING RETURNING: уникальность email проверяет
+    сама БД. Возвращает None, если email уже занят. Коммит делает вызывающий.
+    """
+    # Пароль хешируется заранее в пуле процессов (см. hashing.py)
+    stmt = (
+        insert(models.User)
+        .values(email=user.email, hashed_password=hashed_password)
+        .on_conflict_do_nothing(index_elements=[models.User.email])
+        .returning(models.User)
+    )
+    return (await db.scalars(stmt)).first()
 
 
-def get_user_by_google_id(db: Session, google_id: str):
-    return db.query(models.User).filter(models.User.google_id == google_id).first()
+async def get_user_by_google_id(db: AsyncSession, google_id: str):
+    return await db.scalar(
+        select(models.User).where(models.User.google_id == google_id)
+    )
 
 
-def create_user_from_google(
-    db: Session,
+async def upsert_google_user(
+    db: AsyncSession,
     email: str,
     google_id: str,
     full_name: str | None = None,
     picture_url: str | None = None,
     refresh_token: str | None = None,
 ):
+    """
+    Создаёт пользователя Google или привязывает Google к существующему
+    пользователю с тем же email - одним запросом. Коммит делает вызывающий.
+    """
     encrypted_refresh_token = None
     if refresh_token:
         encryption_manager = get_encryption_manager()
         encrypted_refresh_token = encryption_manager.encrypt(refresh_token)
 
-    db_user = models.User(
+    stmt = insert(models.User).values(
         email=email,
         full_name=full_name,
         picture_url=picture_url,
@@ -54,38 +71,147 @@ def create_user_from_google(
         encrypted_google_refresh_token=encrypted_refresh_token,
         is_active=True,
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.User.email],
+        set_={
+            "google_id": stmt.excluded.google_id,
+            "auth_provider": stmt.excluded.auth_provider,
+            # Без нового refresh token от Google сохраняем прежний
+            "encrypted_google_refresh_token": func.coalesce(
+                stmt.excluded.encrypted_google_refresh_token,
+                models.User.encrypted_google_refresh_token,
+            ),
+        },
+    ).returning(models.User)
+    return (await db.scalars(stmt)).first()
+
+
+def hash_refresh_token(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+
+def create_refresh_token_record(
+    db: AsyncSession,
+    user_id: int,
+    refresh_token: str,
+    session_id: str | None = None,
+    user_agent: str | None = None,
+):
+    """
+    Сохраняет хеш refresh token. Без session_id начинается новая сессия.
+    Коммит делает вызывающий, вместе с остальными изменениями запроса.
+    """
+    db_token = models.RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(refresh_token),
+        session_id=session_id or uuid.uuid4().hex,
+        user_agent=user_agent,
+        expires_at=datetime.now(timezone.utc)
+        + timedelta(days=settings.refresh_token_expire_days),
+    )
+    db.add(db_token)
+    return db_token
 
 
-def link_google_to_existing_user(
-    db: Session, user: models.User, google_id: str, refresh_token: str | None = None
-):
-    user.google_id = google_id
-    user.auth_provider = models.AuthProvider.GOOGLE.value
+async def get_refresh_token_record(db: AsyncSession, refresh_token: str):
+    return await db.scalar(
+        select(models.RefreshToken).where(
+            models.RefreshToken.token_hash == hash_refresh_token(refresh_token)
+        )
+    )
 
-    if refresh_token:
-        encryption_manager = get_encryption_manager()
-        encrypted_refresh_token = encryption_manager.encrypt(refresh_token)
-        user.encrypted_google_refresh_token = encrypted_refresh_token
 
+async def consume_refresh_token(db: AsyncSession, refresh_token: str):
+    """
+    Атомарно отзывает действующий refresh token активного пользователя
+    (UPDATE ... FROM users ... RETURNING) и возвращает данные пользователя
+    и сессии. None - токен не найден, истёк, уже отозван или пользователь
+    неактивен. Коммит делает вызывающий.
+    """
+    now = datetime.now(timezone.utc)
+    stmt = (
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.token_hash == hash_refresh_token(refresh_token),
+            models.RefreshToken.revoked_at.is_(None),
+            models.RefreshToken.expires_at > now,
+            models.RefreshToken.user_id == models.User.id,
+            models.User.is_active.is_(True),
+        )
+        .values(revoked_at=now)
+        .returning(
+            models.RefreshToken.session_id,
+            models.RefreshToken.user_agent,
+            models.User.id,
+            models.User.email,
+            models.User.full_name,
+            models.User.picture_url,
+            models.User.auth_provider,
+            models.User.token_version,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return (await db.execute(stmt)).first()
+
+
+async def revoke_refresh_session(db: AsyncSession, session_id: str):
+    await db.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.session_id == session_id,
+            models.RefreshToken.revoked_at.is_(None),
+        )
+        .values(revoked_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def revoke_user_tokens(db: AsyncSession, user: models.User):
+    """Отзывает все access token (через версию) и все refresh-сессии пользователя"""
+    user.token_version = (user.token_version or 0) + 1
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.execute(
+        update(models.RefreshToken)
+        .where(
+            models.RefreshToken.user_id == user.id,
+            models.RefreshToken.revoked_at.is_(None),
+        )
+        .values(revoked_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    await store_user_state(user.id, UserState(bool(user.is_active), user.token_version))
     return user
 
 
-def update_user_refresh_token(db: Session, user: models.User, refresh_token: str):
-    user.refresh_token = refresh_token
+async def deactivate_user(db: AsyncSession, user: models.User):
+    """Деактивация отзывает и все выданные токены"""
+    user.is_active = False
+    return await revoke_user_tokens(db, user)
+
+
+async def delete_user(db: AsyncSession, user: models.User):
+    user_id = user.id
+    await db.delete(user)
+    await db.commit()
+    await store_user_state(user_id, MISSING_USER)
+
+
+async def update_user_profile(
+    db: AsyncSession,
+    user: models.User,
+    full_name: str | None,
+    picture_url: str | None,
+):
+    user.full_name = full_name
+    user.picture_url = picture_url
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
     return user
 
 
-def get_google_refresh_token(db: Session, user: models.User) -> str | None:
+def get_google_refresh_token(db: AsyncSession, user: models.User) -> str | None:
     if not user.encrypted_google_refresh_token:
         return None
     try:
@@ -93,9 +219,3 @@ def get_google_refresh_token(db: Session, user: models.User) -> str | None:
         return encryption_manager.decrypt(user.encrypted_google_refresh_token)
     except Exception:
         return None
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    if len(plain_password.encode("utf-8")) > 72:
-        plain_password = plain_password[:72]
-    return pwd_context.verify(plain_password, hashed_password)
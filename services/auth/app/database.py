@@ -1,17 +1,17 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 from .config import settings
+from .sql_stats import instrument_engine
 
-engine = create_engine(settings.postgres_auth_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(settings.postgres_auth_async_url)
+# expire_on_commit=False: после коммита объекты не перечитываются из БД
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+instrument_engine(engine.sync_engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,3 +1,4 @@
+import logging
 import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
@@ -5,11 +6,18 @@ from typing import Annotated
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .config import settings
-from .crud import get_user_by_email
-from .database import get_db
+from .crud import (
+    consume_refresh_token,
+    get_refresh_token_record,
+    revoke_refresh_session,
+)
+from .keys import decode_token, sign_token
+from .user_state import get_user_state
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token/")
 
@@ -18,17 +26,17 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, settings.private_key, algorithm=settings.algorithm)
+    return sign_token(to_encode)
 
 
 def create_refresh_token() -> str:
     return secrets.token_urlsafe(64)
 
 
-def create_tokens(user_id: int, email: str) -> dict:
+def create_tokens(user_id: int, email: str, token_version: int = 0) -> dict:
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
-        data={"sub": str(user_id), "email": email},
+        data={"sub": str(user_id), "email": email, "ver": token_version},
         expires_delta=access_token_expires,
     )
     refresh_token = create_refresh_token()
@@ -39,42 +47,50 @@ def create_tokens(user_id: int, email: str) -> dict:
     }
 
 
-def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)
-) -> int:
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> int:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token, settings.public_key, algorithms=[settings.algorithm]
-        )
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
-    user = get_user_by_email(db, payload.get("email"))
-    if user is None:
+    # Состояние пользователя берётся из кеша (память процесса / Redis), без БД
+    user_state = await get_user_state(int(user_id))
+    if not user_state.is_active:
+        raise credentials_exception
+    # Токены без claim "ver" выпущены до появления версий и считаются версией 0
+    if payload.get("ver", 0) != user_state.token_version:
         raise credentials_exception
     return int(user_id)
 
 
-def validate_refresh_token(refresh_token: str, db: Session) -> int:
-    user = get_user_by_refresh_token(db, refresh_token)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid refresh token",
+async def validate_refresh_token(refresh_token: str, db: AsyncSession):
+    """
+    Отзывает предъявленный refresh token и возвращает строку с данными
+    пользователя и сессии для выдачи следующего токена.
+    """
+    consumed = await consume_refresh_token(db, refresh_token)
+    if consumed is not None:
+        return consumed
+
+    # Медленный путь только для ошибок: различаем повторное использование
+    await db.rollback()
+    db_token = await get_refresh_token_record(db, refresh_token)
+    if db_token is not None and db_token.revoked_at is not None:
+        # Уже заменённый токен предъявлен повторно - вероятна кража,
+        # поэтому отзываем всю цепочку этой сессии
+        logger.warning(
+            f"Refresh token reuse detected: user_id={db_token.user_id}, "
+            f"session_id={db_token.session_id}"
         )
-    return user.id
-
-
-def get_user_by_refresh_token(db: Session, refresh_token: str):
-    from . import models
-
-    return (
-        db.query(models.User).filter(models.User.refresh_token == refresh_token).first()
+        await revoke_refresh_session(db, db_token.session_id)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
     )
@@ -1,16 +1,132 @@
+import asyncio
 import logging
+import re
+import time
 
 import httpx
-from sqlalchemy.orm import Session
+import jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import crud
 from .config import settings
 
 logger = logging.getLogger(__name__)
 
+# Один клиент на всё время жизни приложения: keep-alive соединения и HTTP/2
+# избавляют от TCP/TLS рукопожатия на каждый запрос к Google
+_http_client: httpx.AsyncClient | None = None
 
-async def refresh_google_access_token(db: Session, user_id: int) -> dict | None:
-    user = crud.get_user_by_id(db, user_id)
+
+def start_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=settings.google_http_timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=settings.google_http_max_connections,
+                max_keepalive_connections=settings.google_http_max_keepalive_connections,
+            ),
+        )
+
+
+async def stop_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    if _http_client is None:
+        start_http_client()
+    return _http_client
+
+
+class GoogleCertsCache:
+    """
+    Публичные ключи Google (JWKS) в памяти процесса.
+    Время жизни берётся из Cache-Control: max-age ответа Google.
+    """
+
+    def __init__(self):
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._expires_at = 0.0
+        self._refreshed_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def _refresh(self):
+        resp = await get_http_client().get(settings.google_certs_url)
+        resp.raise_for_status()
+        jwks = jwt.PyJWKSet.from_dict(resp.json())
+        self._keys = {key.key_id: key for key in jwks.keys}
+
+        ttl = settings.google_certs_default_ttl_seconds
+        match = re.search(r"max-age=(\d+)", resp.headers.get("cache-control", ""))
+        if match:
+            ttl = int(match.group(1))
+        self._refreshed_at = time.monotonic()
+        self._expires_at = self._refreshed_at + ttl
+        logger.info(f"Google certs refreshed: keys={len(self._keys)}, ttl={ttl}s")
+
+    def _needs_refresh(self, kid: str) -> bool:
+        now = time.monotonic()
+        if now >= self._expires_at:
+            return True
+        # Неизвестный kid (ротация у Google или подделанный заголовок) обновляет
+        # ключи не чаще раза в google_certs_min_refresh_interval_seconds
+        return (
+            kid not in self._keys
+            and now - self._refreshed_at
+            >= settings.google_certs_min_refresh_interval_seconds
+        )
+
+    async def get_key(self, kid: str) -> jwt.PyJWK | None:
+        if self._needs_refresh(kid):
+            async with self._lock:
+                # Другой запрос мог обновить ключи, пока мы ждали блокировку
+                if self._needs_refresh(kid):
+                    await self._refresh()
+        return self._keys.get(kid)
+
+
+google_certs = GoogleCertsCache()
+
+
+async def verify_google_id_token(id_token_str: str, audience: str) -> dict:
+    """Локальная проверка id_token Google. Ошибки сводятся к ValueError"""
+    try:
+        kid = jwt.get_unverified_header(id_token_str).get("kid")
+        key = await google_certs.get_key(kid) if kid else None
+        if key is None:
+            raise ValueError("Unknown signing key")
+        return jwt.decode(
+            id_token_str,
+            key.key,
+            algorithms=["RS256"],
+            audience=audience,
+            issuer=settings.google_issuers.split(","),
+        )
+    except (jwt.PyJWTError, httpx.HTTPError) as e:
+        raise ValueError(str(e)) from e
+
+
+async def exchange_code_for_tokens(code: str) -> httpx.Response:
+    return await get_http_client().post(
+        settings.google_token_url,
+        data={
+            "code": code,
+            "client_id": settings.google_client_id,
+            "client_secret": settings.google_client_secret,
+            "redirect_uri": settings.google_redirect_uri,
+            "grant_type": "authorization_code",
+        },
+        headers={"Accept": "application/json"},
+    )
+
+
+async def refresh_google_access_token(db: AsyncSession, user_id: int) -> dict | None:
+    user = await crud.get_user_by_id(db, user_id)
     if not user:
         logger.error(f"User not found: {user_id}")
         return None
@@ -24,19 +140,17 @@ async def refresh_google_access_token(db: Session, user_id: int) -> dict | None:
         logger.error("Google OAuth credentials not configured")
         return None
 
-    token_url = "https://oauth2.googleapis.com/token"
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                token_url,
-                data={
-                    "client_id": settings.google_client_id,
-                    "client_secret": settings.google_client_secret,
-                    "refresh_token": google_refresh_token,
-                    "grant_type": "refresh_token",
-                },
-                headers={"Accept": "application/json"},
-            )
+        resp = await get_http_client().post(
+            settings.google_token_url,
+            data={
+                "client_id": settings.google_client_id,
+                "client_secret": settings.google_client_secret,
+                "refresh_token": google_refresh_token,
+                "grant_type": "refresh_token",
+            },
+            headers={"Accept": "application/json"},
+        )
     except Exception as e:
         logger.error(f"Failed to refresh Google token: {str(e)}")
         return None
@@ -50,13 +164,11 @@ async def refresh_google_access_token(db: Session, user_id: int) -> dict | None:
 
 
 async def get_google_user_info(access_token: str) -> dict | None:
-    userinfo_url = "https://www.googleapis.com/oauth2/v3/userinfo"
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                userinfo_url,
-                headers={"Authorization": f"Bearer {access_token}"},
-            )
+        resp = await get_http_client().get(
+            settings.google_userinfo_url,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
     except Exception as e:
         logger.error(f"Failed to fetch Google user info: {str(e)}")
         return None
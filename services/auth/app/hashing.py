@@ -0,0 +1,94 @@
+"""
+Хеширование паролей в отдельном пуле процессов.
+
+argon2 нагружает CPU и держит GIL-связанный поток, поэтому хеши считаются
+в ProcessPoolExecutor фиксированного размера. Очередь ограничена
+password_hash_max_pending: при переполнении запрос сразу получает 503,
+а /health и /auth/refresh/ продолжают отвечать во время перебора паролей.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .config import settings
+from .profiling import timed
+
+logger = logging.getLogger(__name__)
+
+# Use argon2 as primary (no 72-byte limit) with bcrypt as fallback
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=settings.argon2_time_cost,
+    argon2__memory_cost=settings.argon2_memory_cost,
+    argon2__parallelism=settings.argon2_parallelism,
+)
+
+_executor: ProcessPoolExecutor | None = None
+_pending = 0
+
+
+def _truncate(password: str) -> str:
+    if len(password.encode("utf-8")) > 72:
+        password = password[:72]
+    return password
+
+
+def hash_password_sync(password: str) -> str:
+    return pwd_context.hash(_truncate(password))
+
+
+def verify_password_sync(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(_truncate(plain_password), hashed_password)
+
+
+def pool_size() -> int:
+    return settings.password_hash_workers or os.cpu_count() or 1
+
+
+def start_pool():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=pool_size())
+        logger.info(f"Password hashing pool started: workers={pool_size()}")
+
+
+def stop_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def _run(func, *args):
+    global _pending
+    if _pending >= settings.password_hash_max_pending:
+        logger.warning(f"Password hashing queue is full: pending={_pending}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service is busy, try again later",
+            headers={"Retry-After": str(settings.password_hash_retry_after_seconds)},
+        )
+    if _executor is None:
+        start_pool()
+
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        with timed("hash"):
+            return await loop.run_in_executor(_executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_password_sync, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_password_sync, plain_password, hashed_password)
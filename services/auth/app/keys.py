@@ -0,0 +1,119 @@
+"""
+Ключи JWT, разобранные один раз на процесс.
+
+PyJWT принимает готовые объекты ключей cryptography, поэтому PEM не
+читается и не разбирается заново на каждую подпись и проверку.
+Токены подписываются с kid - отпечатком публичного ключа, поэтому при
+ротации прежний ключ того же алгоритма продолжает проверяться.
+"""
+
+import hashlib
+from functools import lru_cache
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    PublicFormat,
+    load_pem_private_key,
+    load_pem_public_key,
+)
+
+from .config import SUPPORTED_ALGORITHMS, settings
+from .profiling import timed
+
+ALGORITHM_KEY_TYPES = {
+    "RS256": rsa.RSAPublicKey,
+    "ES256": ec.EllipticCurvePublicKey,
+    "EdDSA": ed25519.Ed25519PublicKey,
+}
+
+
+def key_id(public_key) -> str:
+    """kid - отпечаток публичного ключа (SHA-256 от DER), одинаковый в Auth и Orders"""
+    der = public_key.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+    return hashlib.sha256(der).hexdigest()[:16]
+
+
+def algorithm_for(public_key, expected: str = "") -> str:
+    """Алгоритм по типу ключа; несовпадение с настройкой - ошибка при загрузке"""
+    algorithm = next(
+        (
+            name
+            for name, key_type in ALGORITHM_KEY_TYPES.items()
+            if isinstance(public_key, key_type)
+        ),
+        None,
+    )
+    if algorithm == "ES256" and public_key.curve.name != "secp256r1":
+        algorithm = None
+    if algorithm is None or (expected and algorithm != expected):
+        raise ValueError(
+            f"JWT key {type(public_key).__name__} does not match "
+            f"algorithm {expected or ', '.join(SUPPORTED_ALGORITHMS)}"
+        )
+    return algorithm
+
+
+@lru_cache(maxsize=1)
+def get_verification_keys() -> dict:
+    """kid -> (алгоритм, публичный ключ): текущий и, на время ротации, прежний"""
+    keys = {}
+    for pem, expected in (
+        (settings.public_key, settings.algorithm),
+        (settings.previous_public_key, settings.previous_algorithm),
+    ):
+        if not pem:
+            continue
+        public_key = load_pem_public_key(pem.encode())
+        keys.setdefault(
+            key_id(public_key), (algorithm_for(public_key, expected), public_key)
+        )
+    return keys
+
+
+@lru_cache(maxsize=1)
+def get_signing_key():
+    return load_pem_private_key(settings.private_key.encode("utf-8"), password=None)
+
+
+@lru_cache(maxsize=1)
+def get_signing_kid() -> str:
+    public_key = get_signing_key().public_key()
+    algorithm_for(public_key, settings.algorithm)
+    return key_id(public_key)
+
+
+def sign_token(payload: dict) -> str:
+    with timed("jwt"):
+        return jwt.encode(
+            payload,
+            get_signing_key(),
+            algorithm=settings.algorithm,
+            headers={"kid": get_signing_kid()},
+        )
+
+
+def decode_token(token: str) -> dict:
+    # Ключ выбирается по kid из заголовка, алгоритм - по ключу, а не по alg
+    # из токена. Токены без kid (выпущенные до его появления) проверяются
+    # ключами с алгоритмом из заголовка
+    with timed("jwt"):
+        header = jwt.get_unverified_header(token)
+        keys = get_verification_keys()
+        kid = header.get("kid")
+        if kid is not None:
+            candidates = [keys[kid]] if kid in keys else []
+        else:
+            candidates = [
+                entry for entry in keys.values() if entry[0] == header.get("alg")
+            ]
+        if not candidates:
+            raise jwt.InvalidKeyError(f"Unknown signing key: kid={kid}")
+        for algorithm, key in candidates[:-1]:
+            try:
+                return jwt.decode(token, key, algorithms=[algorithm])
+            except jwt.InvalidSignatureError:
+                continue
+        algorithm, key = candidates[-1]
+        return jwt.decode(token, key, algorithms=[algorithm])
@@ -1,9 +1,33 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 
+from .cache import redis_client
+from .database import engine
+from .google_oauth import start_http_client, stop_http_client
+from .hashing import start_pool, stop_pool
+from .keys import get_signing_kid, get_verification_keys
+from .profiling import ProfilingMiddleware, require_profiling_token
 from .routers.auth import router
+from .sql_stats import SQLStatsMiddleware, explain, query_registry
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ошибка в настройке ключей JWT - при старте, а не на первом запросе
+    get_signing_kid()
+    get_verification_keys()
+    start_pool()
+    start_http_client()
+    yield
+    await stop_http_client()
+    stop_pool()
+    await redis_client.aclose()
+    await engine.dispose()
 
-app = FastAPI(title="Auth Service")
+
+app = FastAPI(title="Auth Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +40,8 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
 )
+app.add_middleware(SQLStatsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 app.include_router(router, tags=["auth"])
 
@@ -23,3 +49,20 @@ app.include_router(router, tags=["auth"])
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/debug/sql", dependencies=[Depends(require_profiling_token)])
+def debug_sql(limit: int = 20):
+    """Самые затратные отпечатки SQL в этом процессе"""
+    return query_registry.top(limit)
+
+
+@app.get(
+    "/debug/sql/{query_id}/explain", dependencies=[Depends(require_profiling_token)]
+)
+async def debug_sql_explain(query_id: str):
+    """Обобщённый план отпечатка и типы параметров последнего медленного выполнения"""
+    sample = await explain(query_id)
+    if sample is None:
+        raise HTTPException(status_code=404, detail="No slow sample for this query")
+    return {"query_id": query_id, **sample}
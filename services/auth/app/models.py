@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from enum import Enum
 
-from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text
 
 from .database import Base
 
@@ -21,11 +21,36 @@ class User(Base):
     auth_provider = Column(String, default=AuthProvider.LOCAL.value, nullable=False)
     google_id = Column(String, unique=True, nullable=True)
     encrypted_google_refresh_token = Column(Text, nullable=True)
-    refresh_token = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
+    # Увеличение версии отзывает все выданные пользователю access token
+    token_version = Column(Integer, default=0, nullable=False)
     created_at = Column(
         DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
     )
     updated_at = Column(
         DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
     )
+
+
+class RefreshToken(Base):
+    """
+    Refresh token хранится только в виде SHA-256 хеша.
+    session_id объединяет цепочку ротаций одного входа (устройства):
+    повторное использование уже заменённого токена отзывает всю сессию.
+    """
+
+    __tablename__ = "refresh_tokens"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False
+    )
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    session_id = Column(String(32), index=True, nullable=False)
+    user_agent = Column(String, nullable=True)
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,184 @@
+"""
+Профилирование отдельных запросов и заголовок Server-Timing.
+
+Server-Timing: время запроса по зависимостям (db, redis, jwt, hash), которое
+код отмечает через timed(); без активного запроса timed() почти ничего не стоит.
+
+Профилировщик включается для запроса заголовком X-Profile со значением
+profiling_token или случайно с вероятностью profiling_sample_rate.
+pyinstrument (или cProfile) работает только вокруг выбранных запросов;
+результат пишется в profiling_dir с маршрутом и задержкой в имени файла:
+HTML pyinstrument и speedscope JSON для flamegraph (https://www.speedscope.app),
+либо .prof для cProfile (snakeviz, flameprof).
+"""
+
+import asyncio
+import cProfile
+import hmac
+import logging
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import MutableHeaders
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+_profiling_active = False
+
+
+def add_timing(name: str, seconds: float):
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name: str):
+    """Учёт времени блока в Server-Timing текущего запроса"""
+    if _timings.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - started)
+
+
+def format_server_timing(timings: dict, total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def token_matches(value: str | None) -> bool:
+    token = settings.profiling_token
+    if not token or value is None:
+        return False
+    return hmac.compare_digest(value.encode(), token.encode())
+
+
+def require_profiling_token(request: Request):
+    """Отладочные эндпоинты закрыты тем же токеном, что и X-Profile"""
+    if not token_matches(request.headers.get(settings.profiling_header)):
+        raise HTTPException(status_code=404, detail="Not found")
+
+
+def should_profile(scope) -> bool:
+    # Профилировщик один на процесс: cProfile и pyinstrument не умеют
+    # профилировать несколько запросов одновременно
+    if _profiling_active:
+        return False
+    header = settings.profiling_header.lower().encode("latin-1")
+    for name, value in scope["headers"]:
+        if name == header and token_matches(value.decode("latin-1")):
+            return True
+    rate = settings.profiling_sample_rate
+    return rate > 0 and random.random() < rate
+
+
+class _Profiler:
+    def __init__(self):
+        self.engine = settings.profiling_engine
+        if self.engine == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self._profiler = Profiler(async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if self.engine == "cprofile":
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def stop(self):
+        if self.engine == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def write(self, scope, status: int, latency: float):
+        route = scope.get("route")
+        path = getattr(route, "path", scope["path"])
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        base = (
+            Path(settings.profiling_dir)
+            / f"{stamp}_{scope['method']}_{slug}_{status}_{latency * 1000:.0f}ms"
+        )
+        base.parent.mkdir(parents=True, exist_ok=True)
+
+        if self.engine == "cprofile":
+            self._profiler.dump_stats(f"{base}.prof")
+            return f"{base}.prof"
+
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        Path(f"{base}.html").write_text(self._profiler.output_html())
+        Path(f"{base}.speedscope.json").write_text(
+            self._profiler.output(renderer=SpeedscopeRenderer())
+        )
+        return f"{base}.html"
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _profiling_active
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = should_profile(scope)
+        if not profile and not settings.server_timing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict = {}
+        token = _timings.set(timings)
+        profiler = _Profiler() if profile else None
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.server_timing_enabled:
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing",
+                        format_server_timing(timings, time.perf_counter() - started),
+                    )
+            await send(message)
+
+        if profiler is not None:
+            _profiling_active = True
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                _profiling_active = False
+                latency = time.perf_counter() - started
+                try:
+                    path = await asyncio.to_thread(
+                        profiler.write, scope, status, latency
+                    )
+                    logger.info(f"Request profile written: {path}")
+                except Exception as e:
+                    logger.error(f"Failed to write request profile: {e}")
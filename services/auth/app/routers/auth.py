@@ -1,38 +1,60 @@
 import logging
 import secrets
 
-import httpx
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from google.auth.transport import requests as google_requests
-from google.oauth2 import id_token
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import crud, schemas
 from ..config import settings
-from ..crud import (
-    create_user_from_google,
-    get_user_by_google_id,
-    link_google_to_existing_user,
-)
+from ..crud import get_user_by_google_id, upsert_google_user
 from ..database import get_db
 from ..dependencies import create_tokens, get_current_user, validate_refresh_token
-from ..google_oauth import get_google_user_info, refresh_google_access_token
+from ..google_oauth import (
+    exchange_code_for_tokens,
+    get_google_user_info,
+    refresh_google_access_token,
+    verify_google_id_token,
+)
+from ..hashing import hash_password, verify_password
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
+def ensure_active(user):
+    # Деактивированный пользователь не получает новых токенов: Orders Service
+    # проверяет access token без обращения к состоянию пользователя
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user"
+        )
+
+
 @router.post("/register/", response_model=schemas.AuthResponse)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, user.email)
-    if db_user:
+async def register(
+    request: Request, user: schemas.UserCreate, db: AsyncSession = Depends(get_db)
+):
+    hashed_password = await hash_password(user.password)
+    # Одна транзакция: INSERT ... ON CONFLICT RETURNING + INSERT refresh token
+    created_user = await crud.create_user(
+        db=db, user=user, hashed_password=hashed_password
+    )
+    if created_user is None:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Email already registered")
-    created_user = crud.create_user(db=db, user=user)
-    tokens = create_tokens(created_user.id, created_user.email)
-    crud.update_user_refresh_token(db, created_user, tokens["refresh_token"])
+    tokens = create_tokens(
+        created_user.id, created_user.email, created_user.token_version
+    )
+    crud.create_refresh_token_record(
+        db,
+        created_user.id,
+        tokens["refresh_token"],
+        user_agent=request.headers.get("user-agent"),
+    )
+    await db.commit()
     return {
         "id": created_user.id,
         "email": created_user.email,
@@ -46,18 +68,31 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/token/", response_model=schemas.AuthResponse)
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login_for_access_token(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db),
 ):
-    user = crud.get_user_by_email(db, form_data.username)
-    if not user or not crud.verify_password(form_data.password, user.hashed_password):
+    user = await crud.get_user_by_email(db, form_data.username)
+    if (
+        not user
+        or not user.hashed_password
+        or not await verify_password(form_data.password, user.hashed_password)
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    tokens = create_tokens(user.id, user.email)
-    crud.update_user_refresh_token(db, user, tokens["refresh_token"])
+    ensure_active(user)
+    tokens = create_tokens(user.id, user.email, user.token_version)
+    crud.create_refresh_token_record(
+        db,
+        user.id,
+        tokens["refresh_token"],
+        user_agent=request.headers.get("user-agent"),
+    )
+    await db.commit()
     return {
         "id": user.id,
         "email": user.email,
@@ -71,30 +106,44 @@ def login_for_access_token(
 
 
 @router.post("/refresh/", response_model=schemas.AuthResponse)
-def refresh_tokens(
-    refresh_request: schemas.RefreshTokenRequest, db: Session = Depends(get_db)
+async def refresh_tokens(
+    refresh_request: schemas.RefreshTokenRequest, db: AsyncSession = Depends(get_db)
 ):
-    user_id = validate_refresh_token(refresh_request.refresh_token, db)
-    user = crud.get_user_by_id(db, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-        )
-    tokens = create_tokens(user.id, user.email)
-    crud.update_user_refresh_token(db, user, tokens["refresh_token"])
+    # Одна транзакция: UPDATE ... RETURNING старого токена + INSERT нового
+    consumed = await validate_refresh_token(refresh_request.refresh_token, db)
+    tokens = create_tokens(consumed.id, consumed.email, consumed.token_version)
+    crud.create_refresh_token_record(
+        db,
+        consumed.id,
+        tokens["refresh_token"],
+        session_id=consumed.session_id,
+        user_agent=consumed.user_agent,
+    )
+    await db.commit()
     return {
-        "id": user.id,
-        "email": user.email,
-        "full_name": user.full_name,
-        "picture_url": user.picture_url,
-        "auth_provider": user.auth_provider,
+        "id": consumed.id,
+        "email": consumed.email,
+        "full_name": consumed.full_name,
+        "picture_url": consumed.picture_url,
+        "auth_provider": consumed.auth_provider,
         "access_token": tokens["access_token"],
         "refresh_token": tokens["refresh_token"],
         "token_type": tokens["token_type"],
     }
 
 
+@router.post("/logout-all/")
+async def logout_all_sessions(
+    user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+):
+    user = await crud.get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    await crud.revoke_user_tokens(db, user)
+    logger.info(f"All sessions revoked: user_id={user_id}")
+    return {"msg": "All sessions revoked"}
+
+
 @router.get("/google/login")
 def google_login(request: Request):
     if not settings.google_client_id:
@@ -128,7 +177,7 @@ def google_login(request: Request):
 
 
 @router.get("/callback/google", response_model=schemas.AuthResponse)
-async def google_callback(request: Request, db: Session = Depends(get_db)):
+async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
     state_from_query = request.query_params.get("state")
     state_from_cookie = request.cookies.get("oauth_state")
 
@@ -162,20 +211,8 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         logger.error("Google OAuth credentials not configured")
         raise HTTPException(status_code=500, detail="Google OAuth not configured")
 
-    token_url = "https://oauth2.googleapis.com/token"
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                token_url,
-                data={
-                    "code": code,
-                    "client_id": settings.google_client_id,
-                    "client_secret": settings.google_client_secret,
-                    "redirect_uri": settings.google_redirect_uri,
-                    "grant_type": "authorization_code",
-                },
-                headers={"Accept": "application/json"},
-            )
+        resp = await exchange_code_for_tokens(code)
     except Exception as e:
         logger.error(f"Failed to connect to Google token endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to connect to Google")
@@ -193,9 +230,7 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="No id_token returned by Google")
 
     try:
-        id_info = id_token.verify_oauth2_token(
-            id_token_str, google_requests.Request(), settings.google_client_id
-        )
+        id_info = await verify_google_id_token(id_token_str, settings.google_client_id)
     except ValueError as e:
         logger.error(f"Invalid Google id_token: {str(e)}")
         raise HTTPException(status_code=400, detail="Invalid Google id_token")
@@ -211,27 +246,28 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
 
     logger.info(f"Verified Google user: {email}")
 
-    user = get_user_by_google_id(db, google_sub)
+    user = await get_user_by_google_id(db, google_sub)
     if not user:
-        user_by_email = crud.get_user_by_email(db, email)
-        if user_by_email:
-            logger.info(f"Linking Google account to existing user: {email}")
-            user = link_google_to_existing_user(
-                db, user_by_email, google_sub, tokens.get("refresh_token")
-            )
-        else:
-            logger.info(f"Creating new user from Google: {email}")
-            user = create_user_from_google(
-                db,
-                email=email,
-                google_id=google_sub,
-                full_name=name,
-                picture_url=picture,
-                refresh_token=tokens.get("refresh_token"),
-            )
-
-    our_tokens = create_tokens(user.id, user.email)
-    crud.update_user_refresh_token(db, user, our_tokens["refresh_token"])
+        # Создание нового пользователя или привязка к существующему email
+        logger.info(f"Creating or linking user from Google: {email}")
+        user = await upsert_google_user(
+            db,
+            email=email,
+            google_id=google_sub,
+            full_name=name,
+            picture_url=picture,
+            refresh_token=tokens.get("refresh_token"),
+        )
+
+    ensure_active(user)
+    our_tokens = create_tokens(user.id, user.email, user.token_version)
+    crud.create_refresh_token_record(
+        db,
+        user.id,
+        our_tokens["refresh_token"],
+        user_agent=request.headers.get("user-agent"),
+    )
+    await db.commit()
 
     logger.info(f"User authenticated via Google: user_id={user.id}")
 
@@ -254,7 +290,7 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
 
 @router.post("/google/refresh-info", response_model=schemas.UserOut)
 async def refresh_google_user_info(
-    user_id: int = Depends(get_current_user), db: Session = Depends(get_db)
+    user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_db)
 ):
     tokens = await refresh_google_access_token(db, user_id)
     if not tokens:
@@ -277,18 +313,19 @@ async def refresh_google_user_info(
             detail="Failed to fetch user info from Google",
         )
 
-    user = crud.get_user_by_id(db, user_id)
+    user = await crud.get_user_by_id(db, user_id)
     if not user:
         raise HTTPException(
             status_code=404,
             detail="User not found",
         )
 
-    user.full_name = user_info.get("name", user.full_name)
-    user.picture_url = user_info.get("picture", user.picture_url)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    user = await crud.update_user_profile(
+        db,
+        user,
+        full_name=user_info.get("name", user.full_name),
+        picture_url=user_info.get("picture", user.picture_url),
+    )
 
     return {
         "id": user.id,
@@ -0,0 +1,155 @@
+"""
+Кеш состояния пользователей (активен ли, текущая версия токенов) для
+проверки access token без обращения к БД.
+
+Два уровня: LRU-словарь в памяти процесса с коротким TTL и Redis.
+При деактивации, удалении пользователя или отзыве сессий в Redis сразу
+записывается новое состояние (для удалённого - запись-надгробие), а не
+удаляется ключ: иначе параллельное чтение из БД, начатое до коммита, вернуло
+бы в кеш старое состояние на user_state_cache_ttl_seconds. Заполнение из БД
+не перезаписывает существующую запись, обновление не откатывает версию назад.
+Локальные копии в других процессах истекают через user_state_local_ttl_seconds -
+это и есть задержка вступления отзыва в силу.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .cache import redis_client
+from .config import settings
+from .profiling import timed
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UserState:
+    is_active: bool
+    token_version: int
+
+
+# Пользователь не найден в БД - кешируем как неактивного
+MISSING_USER = UserState(is_active=False, token_version=-1)
+
+# mode: fill - только если записи нет (заполнение из БД);
+# update - если записи нет или её версия не новее; force - всегда (удаление)
+_WRITE_STATE = redis_client.register_script("""
+local current = redis.call('HGET', KEYS[1], 'token_version')
+if current and ARGV[4] == 'fill' then
+    return 0
+end
+if current and ARGV[4] == 'update' and tonumber(current) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'is_active', ARGV[1], 'token_version', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+""")
+
+
+class _LocalCache:
+    """LRU с TTL: не больше max_size записей, самые давние вытесняются"""
+
+    def __init__(self, max_size: int):
+        self._items: OrderedDict[int, tuple[float, UserState]] = OrderedDict()
+        self._max_size = max_size
+
+    def get(self, user_id: int, now: float) -> UserState | None:
+        cached = self._items.get(user_id)
+        if cached is None:
+            return None
+        if cached[0] <= now:
+            del self._items[user_id]
+            return None
+        self._items.move_to_end(user_id)
+        return cached[1]
+
+    def set(self, user_id: int, state: UserState, expires_at: float):
+        self._items[user_id] = (expires_at, state)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, user_id: int):
+        self._items.pop(user_id, None)
+
+
+_local_cache = _LocalCache(settings.user_state_local_max_entries)
+
+
+def _redis_key(user_id: int) -> str:
+    return f"auth:user_state:{user_id}"
+
+
+async def _load_from_db(user_id: int) -> UserState:
+    from .crud import get_user_by_id
+    from .database import SessionLocal
+
+    async with SessionLocal() as db:
+        user = await get_user_by_id(db, user_id)
+        if user is None:
+            return MISSING_USER
+        return UserState(
+            is_active=bool(user.is_active), token_version=user.token_version or 0
+        )
+
+
+async def _get_from_redis(user_id: int) -> UserState | None:
+    try:
+        with timed("redis"):
+            data = await redis_client.hgetall(_redis_key(user_id))
+    except Exception as e:
+        logger.warning(f"Failed to read user state from Redis: {str(e)}")
+        return None
+    if not data:
+        return None
+    return UserState(
+        is_active=data.get("is_active") == "1",
+        token_version=int(data.get("token_version", 0)),
+    )
+
+
+async def _write_to_redis(user_id: int, state: UserState, mode: str):
+    with timed("redis"):
+        await _WRITE_STATE(
+            keys=[_redis_key(user_id)],
+            args=[
+                "1" if state.is_active else "0",
+                state.token_version,
+                settings.user_state_cache_ttl_seconds,
+                mode,
+            ],
+        )
+
+
+async def get_user_state(user_id: int) -> UserState:
+    now = time.monotonic()
+    state = _local_cache.get(user_id, now)
+    if state is not None:
+        return state
+
+    state = await _get_from_redis(user_id)
+    if state is None:
+        state = await _load_from_db(user_id)
+        try:
+            await _write_to_redis(user_id, state, "fill")
+        except Exception as e:
+            logger.warning(f"Failed to write user state to Redis: {str(e)}")
+
+    _local_cache.set(user_id, state, now + settings.user_state_local_ttl_seconds)
+    return state
+
+
+async def store_user_state(user_id: int, state: UserState):
+    """
+    Вызывать после коммита любого изменения is_active / token_version
+    (для удалённого пользователя - с MISSING_USER)
+    """
+    _local_cache.pop(user_id)
+    mode = "force" if state == MISSING_USER else "update"
+    try:
+        await _write_to_redis(user_id, state, mode)
+    except Exception as e:
+        logger.error(f"Failed to store user state for {user_id}: {str(e)}")
@@ -0,0 +1,53 @@
+"""
+Управление пользователями из консоли. Изменения сразу попадают в кеш
+состояния (user_state), так что токены перестают приниматься в течение
+user_state_local_ttl_seconds.
+
+Запуск вручную:
+    python -m app.users deactivate user@example.com
+    python -m app.users delete user@example.com
+    python -m app.users revoke user@example.com   # отозвать все сессии
+"""
+
+import argparse
+import asyncio
+import logging
+
+from . import crud
+from .cache import redis_client
+from .database import SessionLocal, engine
+
+ACTIONS = {
+    "deactivate": crud.deactivate_user,
+    "delete": crud.delete_user,
+    "revoke": crud.revoke_user_tokens,
+}
+
+
+async def run(action: str, email: str) -> bool:
+    try:
+        async with SessionLocal() as db:
+            user = await crud.get_user_by_email(db, email)
+            if user is None:
+                return False
+            await ACTIONS[action](db, user)
+            return True
+    finally:
+        await redis_client.aclose()
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage auth users")
+    parser.add_argument("action", choices=sorted(ACTIONS))
+    parser.add_argument("email")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not asyncio.run(run(args.action, args.email)):
+        raise SystemExit(f"User not found: {args.email}")
+    print(f"{args.action}: {args.email}")
+
+
+if __name__ == "__main__":
+    main()
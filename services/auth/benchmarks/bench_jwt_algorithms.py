@@ -0,0 +1,58 @@
+"""
+Подпись и проверка access token: операций/сек для RS256, ES256 и EdDSA.
+
+Запуск из каталога services/auth:
+    python -m benchmarks.bench_jwt_algorithms --iterations 2000
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+KEY_FACTORIES = {
+    "RS256": lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "ES256": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "EdDSA": ed25519.Ed25519PrivateKey.generate,
+}
+
+
+def measure(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JWT algorithms")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    payload = {
+        "sub": "1",
+        "email": "user@example.com",
+        "ver": 0,
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=30),
+    }
+    print(f"{'algorithm':>9}  {'sign/sec':>10}  {'verify/sec':>10}")
+    for algorithm, key_factory in KEY_FACTORIES.items():
+        private_key = key_factory()
+        public_key = private_key.public_key()
+        token = jwt.encode(payload, private_key, algorithm=algorithm)
+
+        sign_rate = measure(
+            lambda: jwt.encode(payload, private_key, algorithm=algorithm),
+            args.iterations,
+        )
+        verify_rate = measure(
+            lambda: jwt.decode(token, public_key, algorithms=[algorithm]),
+            args.iterations,
+        )
+        print(f"{algorithm:>9}  {sign_rate:>10.0f}  {verify_rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
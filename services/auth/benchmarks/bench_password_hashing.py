@@ -0,0 +1,56 @@
+"""
+Пропускная способность проверки паролей (логинов/сек) при текущих
+параметрах argon2 из Settings, для пула из 1..N процессов.
+
+Запуск из каталога services/auth:
+    python -m benchmarks.bench_password_hashing --iterations 200
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.config import settings
+from app.hashing import hash_password_sync, verify_password_sync
+
+
+def run(workers: int, iterations: int, hashed: str) -> float:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Прогрев: поднимаем процессы до начала замера
+        list(
+            executor.map(verify_password_sync, ["secret"] * workers, [hashed] * workers)
+        )
+        started = time.perf_counter()
+        list(
+            executor.map(
+                verify_password_sync, ["secret"] * iterations, [hashed] * iterations
+            )
+        )
+        return iterations / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password verification")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(
+        f"argon2: time_cost={settings.argon2_time_cost}, "
+        f"memory_cost={settings.argon2_memory_cost} KiB, "
+        f"parallelism={settings.argon2_parallelism}"
+    )
+    hashed = hash_password_sync("secret")
+    workers = 1
+    while workers <= args.max_workers:
+        rate = run(workers, args.iterations, hashed)
+        print(
+            f"workers={workers:3d}  logins/sec={rate:8.1f}  "
+            f"per core={rate / workers:8.1f}"
+        )
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Масштабирование RPS от числа воркеров gunicorn (gunicorn.conf.py).
+
+Для каждого числа воркеров поднимается отдельный gunicorn на локальном порту,
+нагрузка подаётся несколькими процессами с keep-alive соединениями.
+По умолчанию - /health, которому не нужны БД и Redis; с --path можно взять
+эндпоинт тяжелее, если зависимости доступны.
+
+Запуск из каталога services/auth:
+    python -m benchmarks.bench_workers --workers 1 2 4 --duration 10
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+async def _load(url: str, connections: int, duration: float) -> int:
+    done = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(limits=limits) as client:
+
+        async def loop():
+            nonlocal done
+            while time.perf_counter() < deadline:
+                resp = await client.get(url)
+                if resp.status_code == 200:
+                    done += 1
+
+        await asyncio.gather(*(loop() for _ in range(connections)))
+    return done
+
+
+def _load_process(url: str, connections: int, duration: float, results):
+    results.put(asyncio.run(_load(url, connections, duration)))
+
+
+def run_load(url: str, processes: int, connections: int, duration: float) -> float:
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_load_process, args=(url, connections, duration, results)
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    total = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return total / duration
+
+
+def wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not become ready: {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RPS by gunicorn workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--load-processes", type=int, default=2)
+    parser.add_argument("--connections", type=int, default=64)
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.port}{args.path}"
+    print(f"{'workers':>7}  {'rps':>10}  {'speedup':>7}")
+    baseline = None
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "-c",
+                "gunicorn.conf.py",
+                "--workers",
+                str(workers),
+                "--bind",
+                f"127.0.0.1:{args.port}",
+                "--access-logfile",
+                "/dev/null",
+                "app.main:app",
+            ],
+            env={**os.environ, "WEB_CONCURRENCY": str(workers)},
+        )
+        try:
+            wait_ready(url)
+            rps = run_load(url, args.load_processes, args.connections, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or rps
+        print(f"{workers:>7}  {rps:>10.0f}  {rps / baseline:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,4 +9,9 @@ fi
 
 echo "Starting FastAPI application..."
 cd /app
+# SERVER_MODE=gunicorn - несколько процессов (WEB_CONCURRENCY, по умолчанию
+# по числу CPU), иначе один процесс uvicorn
+if [ "${SERVER_MODE}" = "gunicorn" ]; then
+    exec gunicorn -c gunicorn.conf.py app.main:app
+fi
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000
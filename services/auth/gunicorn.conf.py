@@ -0,0 +1,31 @@
+"""
+Многопроцессный режим: gunicorn управляет воркерами uvicorn.
+
+Приложение импортируется один раз в мастере (preload_app), ключи JWT
+разбираются до fork и достаются воркерам копией страниц памяти. Пул хеширования
+паролей, HTTP-клиент Google, Redis и пул БД создаются в lifespan каждого воркера,
+поэтому AUTH_PASSWORD_HASH_WORKERS стоит уменьшить пропорционально числу воркеров.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Async-воркер загружает ядро целиком, поэтому по одному на CPU
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "app.server.UvloopWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = "-"
+
+
+def when_ready(server):
+    from app.keys import get_signing_kid, get_verification_keys
+
+    get_signing_kid()
+    get_verification_keys()
+    server.log.info(f"JWT keys preloaded, workers={workers}")
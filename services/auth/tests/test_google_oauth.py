@@ -0,0 +1,178 @@
+"""
+Клиент Google OAuth против локального mock эндпоинтов Google
+(httpx.MockTransport вместо сети).
+
+Запуск из каталога services/auth:
+    pip install -r requirements-dev.txt
+    python -m pytest
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+from app import google_oauth
+from app.config import settings
+
+AUDIENCE = "test-client-id"
+
+
+def make_signing_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update({"kid": kid, "alg": "RS256", "use": "sig"})
+    return private_key, jwk
+
+
+def make_id_token(private_key, kid: str, audience: str = AUDIENCE, **claims) -> str:
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": audience,
+        "sub": "google-user-1",
+        "email": "user@example.com",
+        "iat": now,
+        "exp": now + 300,
+        **claims,
+    }
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+class MockGoogle:
+    """Эндпоинты Google: JWKS, обмен кода на токены, userinfo"""
+
+    def __init__(self, jwks: list[dict], max_age: int = 3600):
+        self.jwks = jwks
+        self.max_age = max_age
+        self.requests: list[httpx.Request] = []
+
+    def count(self, url: str) -> int:
+        return sum(1 for request in self.requests if str(request.url) == url)
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        url = str(request.url)
+        if url == settings.google_certs_url:
+            return httpx.Response(
+                200,
+                json={"keys": self.jwks},
+                headers={"Cache-Control": f"public, max-age={self.max_age}"},
+            )
+        if url == settings.google_token_url:
+            return httpx.Response(
+                200, json={"access_token": "google-access", "id_token": "id"}
+            )
+        if url == settings.google_userinfo_url:
+            if request.headers.get("authorization") != "Bearer google-access":
+                return httpx.Response(401, json={"error": "invalid_token"})
+            return httpx.Response(200, json={"sub": "google-user-1"})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def signing_key():
+    return make_signing_key("key-1")
+
+
+@pytest.fixture
+def google(monkeypatch, signing_key):
+    mock = MockGoogle([signing_key[1]])
+    monkeypatch.setattr(
+        google_oauth,
+        "_http_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(mock)),
+    )
+    monkeypatch.setattr(google_oauth, "google_certs", google_oauth.GoogleCertsCache())
+    return mock
+
+
+def test_id_token_verified_locally_with_cached_jwks(google, signing_key):
+    token = make_id_token(signing_key[0], "key-1")
+
+    async def scenario():
+        first = await google_oauth.verify_google_id_token(token, AUDIENCE)
+        second = await google_oauth.verify_google_id_token(token, AUDIENCE)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["sub"] == second["sub"] == "google-user-1"
+    # Ключи взяты из кеша: один запрос JWKS на две проверки
+    assert google.count(settings.google_certs_url) == 1
+
+
+def test_jwks_refetched_after_max_age(google, signing_key, monkeypatch):
+    google.max_age = 60
+    token = make_id_token(signing_key[0], "key-1")
+    clock = [1000.0]
+    monkeypatch.setattr(
+        google_oauth, "time", SimpleNamespace(monotonic=lambda: clock[0])
+    )
+
+    async def scenario():
+        await google_oauth.verify_google_id_token(token, AUDIENCE)
+        clock[0] += 59
+        await google_oauth.verify_google_id_token(token, AUDIENCE)
+        clock[0] += 2
+        await google_oauth.verify_google_id_token(token, AUDIENCE)
+
+    asyncio.run(scenario())
+    assert google.count(settings.google_certs_url) == 2
+
+
+def test_wrong_audience_rejected(google, signing_key):
+    token = make_id_token(signing_key[0], "key-1", audience="someone-else")
+    with pytest.raises(ValueError):
+        asyncio.run(google_oauth.verify_google_id_token(token, AUDIENCE))
+
+
+def test_unknown_kid_refresh_is_rate_limited(google, signing_key):
+    forged_key, _ = make_signing_key("forged")
+    forged = make_id_token(forged_key, "forged")
+
+    async def scenario():
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                await google_oauth.verify_google_id_token(forged, AUDIENCE)
+
+    asyncio.run(scenario())
+    # Первый запрос загрузил JWKS, остальные неизвестные kid - без запросов
+    assert google.count(settings.google_certs_url) == 1
+
+
+def test_rotated_key_picked_up_after_refresh_interval(google, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(
+        google_oauth, "time", SimpleNamespace(monotonic=lambda: clock[0])
+    )
+    rotated_key, rotated_jwk = make_signing_key("key-2")
+    token = make_id_token(rotated_key, "key-2")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await google_oauth.verify_google_id_token(token, AUDIENCE)
+        google.jwks.append(rotated_jwk)
+        clock[0] += settings.google_certs_min_refresh_interval_seconds
+        return await google_oauth.verify_google_id_token(token, AUDIENCE)
+
+    assert asyncio.run(scenario())["sub"] == "google-user-1"
+    assert google.count(settings.google_certs_url) == 2
+
+
+def test_token_exchange_and_userinfo(google):
+    async def scenario():
+        tokens = (await google_oauth.exchange_code_for_tokens("code")).json()
+        return await google_oauth.get_google_user_info(tokens["access_token"])
+
+    assert asyncio.run(scenario()) == {"sub": "google-user-1"}
+    exchange = next(
+        request
+        for request in google.requests
+        if str(request.url) == settings.google_token_url
+    )
+    assert b"grant_type=authorization_code" in exchange.content
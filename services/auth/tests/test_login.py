@@ -0,0 +1,108 @@
+"""
+Вход по паролю и через Google для деактивированного пользователя: токены
+не выдаются. БД, хеширование и Google подменены, lifespan не запускается.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.database import get_db
+from app.main import app
+from app.routers import auth
+
+
+class FakeSession:
+    def __init__(self):
+        self.commits = 0
+
+    async def commit(self):
+        self.commits += 1
+
+
+def make_user(is_active: bool):
+    return SimpleNamespace(
+        id=1,
+        email="user@example.com",
+        hashed_password="hash",
+        token_version=0,
+        is_active=is_active,
+    )
+
+
+async def async_return(value):
+    return value
+
+
+@pytest.fixture
+def db():
+    session = FakeSession()
+    app.dependency_overrides[get_db] = lambda: session
+    yield session
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def issued(monkeypatch):
+    calls = []
+
+    def create_tokens(*args):
+        calls.append(args)
+        return {"access_token": "a", "refresh_token": "r", "token_type": "bearer"}
+
+    monkeypatch.setattr(auth, "create_tokens", create_tokens)
+    return calls
+
+
+def test_password_login_rejects_inactive_user(monkeypatch, db, issued):
+    monkeypatch.setattr(
+        auth.crud, "get_user_by_email", lambda db, email: async_return(make_user(False))
+    )
+    monkeypatch.setattr(auth, "verify_password", lambda *args: async_return(True))
+
+    response = TestClient(app).post(
+        "/auth/token/", data={"username": "user@example.com", "password": "secret"}
+    )
+
+    assert response.status_code == 403
+    assert issued == [] and db.commits == 0
+
+
+def test_password_login_wrong_password_not_reported_as_inactive(monkeypatch, db):
+    monkeypatch.setattr(
+        auth.crud, "get_user_by_email", lambda db, email: async_return(make_user(False))
+    )
+    monkeypatch.setattr(auth, "verify_password", lambda *args: async_return(False))
+
+    response = TestClient(app).post(
+        "/auth/token/", data={"username": "user@example.com", "password": "wrong"}
+    )
+
+    # Состояние учётной записи раскрывается только после проверки пароля
+    assert response.status_code == 401
+
+
+def test_google_callback_rejects_inactive_user(monkeypatch, db, issued):
+    monkeypatch.setattr(settings, "google_client_id", "client-id")
+    monkeypatch.setattr(settings, "google_client_secret", "client-secret")
+    token_response = SimpleNamespace(status_code=200, json=lambda: {"id_token": "id"})
+    monkeypatch.setattr(
+        auth, "exchange_code_for_tokens", lambda code: async_return(token_response)
+    )
+    monkeypatch.setattr(
+        auth,
+        "verify_google_id_token",
+        lambda *args: async_return({"sub": "google-1", "email": "user@example.com"}),
+    )
+    monkeypatch.setattr(
+        auth, "get_user_by_google_id", lambda db, sub: async_return(make_user(False))
+    )
+
+    client = TestClient(app)
+    client.cookies.set("oauth_state", "state")
+    response = client.get("/auth/callback/google?state=state&code=code")
+
+    assert response.status_code == 403
+    assert issued == [] and db.commits == 0
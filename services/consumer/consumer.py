@@ -1,69 +1,379 @@
+"""
+Потребитель Kafka: заказы из топика new_order превращаются в задачи Celery.
+
+Сообщение, которое не удалось обработать, не теряется и не блокирует секцию:
+оно уходит на ступень повторов (new_order.retry.10s, new_order.retry.1m, ...),
+где ждёт своего времени, а после последней ступени - в new_order.dlq
+с метаданными ошибки. Сообщения, повтор которых бессмыслен (битый JSON,
+нет order_id), сразу попадают в DLQ.
+
+Запуск:
+    python consumer.py                          # обработка new_order и повторов
+    python consumer.py replay [--limit N]       # вернуть сообщения из DLQ в new_order
+    python consumer.py replay --dry-run         # только показать содержимое DLQ
+"""
+
+import argparse
 import asyncio
 import json
 import logging
 import os
+import time
 
-from aiokafka import AIOKafkaConsumer
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka.coordinator.assignors.sticky.sticky_assignor import (
+    StickyPartitionAssignor,
+)
+from aiokafka.errors import CommitFailedError
 from celery import Celery
+from prometheus_client import Counter, Gauge, start_http_server
+from redis import Redis
 
 # Логирование
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+KAFKA_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
+NEW_ORDER_TOPIC = os.getenv("NEW_ORDER_TOPIC", "new_order")
+GROUP_ID = os.getenv("CONSUMER_GROUP_ID", "order_consumer_group")
+# Потребителей группы в одном процессе; всего в группе полезно не больше,
+# чем секций в топике - лишние простаивают
+WORKERS = int(os.getenv("CONSUMER_WORKERS", "1"))
+MAX_RECORDS = int(os.getenv("CONSUMER_MAX_RECORDS", "100"))
+# Должны совпадать с ORDERS_NEW_ORDER_RETRY_TIERS сервиса Orders
+RETRY_TIERS = os.getenv("NEW_ORDER_RETRY_TIERS", "10s,1m")
+
+DLQ_TOPIC = f"{NEW_ORDER_TOPIC}.dlq"
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
+CELERY_QUEUE = os.getenv("CELERY_QUEUE", "celery")
+# Обратное давление: при глубине очереди Celery >= HIGH секции ставятся на паузу,
+# при <= LOW снимаются с неё. Необработанные заказы копятся в Kafka, а не в Redis
+BACKPRESSURE_HIGH_WATERMARK = int(os.getenv("BACKPRESSURE_HIGH_WATERMARK", "1000"))
+BACKPRESSURE_LOW_WATERMARK = int(os.getenv("BACKPRESSURE_LOW_WATERMARK", "200"))
+BACKPRESSURE_CHECK_INTERVAL = float(os.getenv("BACKPRESSURE_CHECK_INTERVAL", "1"))
+METRICS_PORT = int(os.getenv("CONSUMER_METRICS_PORT", "9100"))
+
 # Инициализация Celery
 celery_app = Celery(
     "consumer",
-    broker=os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"),
+    broker=CELERY_BROKER_URL,
     backend=os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/1"),
 )
 
+# Метрики Prometheus (http://consumer:9100/metrics)
+CELERY_QUEUE_DEPTH = Gauge(
+    "order_consumer_celery_queue_depth",
+    "Задачи в очереди Celery: ожидающие и выданные воркерам без подтверждения",
+)
+CONSUMER_PAUSED = Gauge(
+    "order_consumer_paused", "1 - чтение из Kafka приостановлено обратным давлением"
+)
+CONSUMER_PAUSES = Counter(
+    "order_consumer_pauses", "Сколько раз чтение из Kafka ставилось на паузу"
+)
 
-async def consume():
+
+def parse_retry_topics(tiers: str) -> list[tuple[str, int]]:
+    """(топик, задержка в секундах) для каждой ступени: "10s,1m" -> 10, 60"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    return [
+        (f"{NEW_ORDER_TOPIC}.retry.{tier}", int(tier[:-1]) * units[tier[-1]])
+        for tier in (t.strip() for t in tiers.split(","))
+        if tier
+    ]
+
+
+RETRY_TOPICS = parse_retry_topics(RETRY_TIERS)
+
+
+class Backpressure:
     """
-    Потребитель Kafka сообщений.
-    Слушает топик 'new_order' и отправляет задачи в Celery.
+    Следит за глубиной очереди Celery в Redis-брокере и решает, читать ли
+    из Kafka. Между HIGH и LOW состояние не меняется (гистерезис), чтобы
+    потребители не переключались на каждой проверке.
     """
-    kafka_servers = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
 
+    def __init__(self):
+        self.paused = False
+        self._redis = Redis.from_url(CELERY_BROKER_URL)
+
+    def queue_depth(self) -> int:
+        pipe = self._redis.pipeline()
+        pipe.llen(CELERY_QUEUE)
+        # Задачи, выданные воркерам и ещё не подтверждённые (visibility timeout)
+        pipe.hlen("unacked")
+        ready, unacked = pipe.execute()
+        return ready + unacked
+
+    def update(self, depth: int):
+        CELERY_QUEUE_DEPTH.set(depth)
+        if not self.paused and depth >= BACKPRESSURE_HIGH_WATERMARK:
+            self.paused = True
+            CONSUMER_PAUSES.inc()
+            logger.warning(f"Очередь Celery {depth} задач: чтение из Kafka на паузе")
+        elif self.paused and depth <= BACKPRESSURE_LOW_WATERMARK:
+            self.paused = False
+            logger.info(f"Очередь Celery {depth} задач: чтение из Kafka продолжено")
+        CONSUMER_PAUSED.set(1 if self.paused else 0)
+
+    async def run(self):
+        while True:
+            try:
+                depth = await asyncio.to_thread(self.queue_depth)
+            except Exception as e:
+                # Состояние не меняется: без данных о брокере решения не принимаем
+                logger.warning(f"Не удалось получить глубину очереди Celery: {e}")
+            else:
+                self.update(depth)
+            await asyncio.sleep(BACKPRESSURE_CHECK_INTERVAL)
+
+    def apply(self, consumer: AIOKafkaConsumer):
+        """Пауза или возобновление всех секций потребителя перед очередным чтением"""
+        if self.paused:
+            # Секции, полученные после ребалансировки, тоже ставятся на паузу
+            consumer.pause(*consumer.assignment())
+        elif consumer.paused():
+            consumer.resume(*consumer.paused())
+
+
+backpressure = Backpressure()
+
+
+class PoisonMessage(Exception):
+    """Сообщение, которое нет смысла повторять"""
+
+
+def get_header(msg, name: str, default: str | None = None) -> str | None:
+    for key, value in msg.headers or ():
+        if key == name:
+            return value.decode()
+    return default
+
+
+def parse_order(msg) -> dict:
+    try:
+        data = json.loads(msg.value)
+    except json.JSONDecodeError as e:
+        raise PoisonMessage(f"Ошибка при разборе JSON: {e}")
+    order_id = data.get("order_id") if isinstance(data, dict) else None
+    if not order_id:
+        raise PoisonMessage("Сообщение без order_id")
+    return data
+
+
+def original_location(msg) -> dict:
+    """Топик, секция и offset, где сообщение появилось впервые"""
+    return {
+        "topic": get_header(msg, "original_topic", msg.topic),
+        "partition": int(get_header(msg, "original_partition", str(msg.partition))),
+        "offset": int(get_header(msg, "original_offset", str(msg.offset))),
+    }
+
+
+def dispatch(order: dict, attempt: int, source: dict):
+    """Отправка задачи в Celery (блокирующий вызов)"""
+    celery_app.send_task(
+        "app.tasks.process_order",
+        args=[order["order_id"]],
+        # created_at позволяет задаче читать одну секцию orders
+        kwargs={
+            "attempt": attempt,
+            "source": source,
+            "created_at": order.get("created_at"),
+        },
+    )
+    logger.info(f"Задача Celery отправлена для заказа {order['order_id']}")
+
+
+async def send_to_failure_topic(
+    producer: AIOKafkaProducer, msg, attempt: int, error: str, dead: bool = False
+):
+    """
+    Следующая ступень повторов (attempt - число уже случившихся неудач)
+    или DLQ. Исходные топик, секция и offset сохраняются в заголовках.
+    """
+    if dead or attempt >= len(RETRY_TOPICS):
+        topic, delay = DLQ_TOPIC, 0
+    else:
+        topic, delay = RETRY_TOPICS[attempt]
+    source = original_location(msg)
+    headers = [
+        ("attempt", str(attempt + 1).encode()),
+        ("not_before", str(int((time.time() + delay) * 1000)).encode()),
+        ("error", error[:1000].encode()),
+        ("original_topic", source["topic"].encode()),
+        ("original_partition", str(source["partition"]).encode()),
+        ("original_offset", str(source["offset"]).encode()),
+    ]
+    await producer.send_and_wait(topic, msg.value, key=msg.key, headers=headers)
+    logger.warning(f"Сообщение {msg.topic}:{msg.offset} отправлено в {topic}: {error}")
+
+
+async def process_message(producer: AIOKafkaProducer, msg):
+    attempt = int(get_header(msg, "attempt", "0"))
+    # В топиках повторов сообщение ждёт своего времени. Задержка на ступени
+    # одинаковая, поэтому следующие сообщения секции ждут не дольше первого
+    wait = int(get_header(msg, "not_before", "0")) / 1000 - time.time()
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+    try:
+        order = parse_order(msg)
+    except PoisonMessage as e:
+        await send_to_failure_topic(producer, msg, attempt, str(e), dead=True)
+        return
+
+    logger.info(
+        f"Получено сообщение для заказа: {order['order_id']} "
+        f"({msg.topic}, секция {msg.partition}, offset {msg.offset})"
+    )
+    try:
+        await asyncio.to_thread(dispatch, order, attempt, original_location(msg))
+    except Exception as e:
+        logger.error(f"Ошибка при обработке сообщения: {e}")
+        await send_to_failure_topic(producer, msg, attempt, str(e))
+
+
+async def process_partition(producer: AIOKafkaProducer, messages):
+    # Внутри секции строго по порядку: события одного ключа не переставляются
+    for msg in messages:
+        await process_message(producer, msg)
+
+
+async def run_worker(
+    name: str, topic: str, group_id: str, producer: AIOKafkaProducer, max_delay=0
+):
+    """
+    Один потребитель группы. Секции, полученные из getmany, обрабатываются
+    параллельно, offset коммитится после обработки всей пачки (at-least-once).
+    """
     consumer = AIOKafkaConsumer(
-        "new_order",
-        bootstrap_servers=kafka_servers,
-        group_id="order_consumer_group",
+        topic,
+        bootstrap_servers=KAFKA_SERVERS,
+        group_id=group_id,
+        client_id=f"order-consumer-{os.getpid()}-{name}",
         auto_offset_reset="earliest",
+        enable_auto_commit=False,
+        # Ожидание в топике повторов не должно исключать потребителя из группы
+        max_poll_interval_ms=max(300_000, (max_delay + 60) * 1000),
+        # Sticky сохраняет за потребителем его секции при ребалансировке
+        partition_assignment_strategy=(StickyPartitionAssignor,),
     )
 
     try:
-        logger.info(f"Подключение к Kafka: {kafka_servers}")
         await consumer.start()
-        logger.info("Потребитель Kafka успешно запущен")
+        logger.info(f"Потребитель Kafka {name} ({topic}) успешно запущен")
 
-        async for msg in consumer:
+        while True:
+            backpressure.apply(consumer)
+            batches = await consumer.getmany(timeout_ms=1000, max_records=MAX_RECORDS)
+            if not batches:
+                continue
+            await asyncio.gather(
+                *(
+                    process_partition(producer, messages)
+                    for messages in batches.values()
+                )
+            )
             try:
-                data = json.loads(msg.value)
-                order_id = data.get("order_id")
+                await consumer.commit()
+            except CommitFailedError as e:
+                # Секции ушли другому потребителю во время обработки: пачка
+                # будет доставлена повторно, process_order это переносит
+                logger.warning(f"Коммит offset не удался после ребалансировки: {e}")
 
-                if not order_id:
-                    logger.warning(f"Сообщение без order_id: {msg.value}")
-                    continue
+    except Exception as e:
+        logger.error(f"Ошибка потребителя Kafka {name}: {e}")
+        raise
+    finally:
+        await consumer.stop()
+        logger.info(f"Потребитель Kafka {name} остановлен")
 
-                logger.info(f"Получено сообщение для заказа: {order_id}")
 
-                # Отправка задачи в Celery
-                celery_app.send_task("app.tasks.process_order", args=[order_id])
-                logger.info(f"Задача Celery отправлена для заказа {order_id}")
+async def consume():
+    """
+    Потребитель Kafka сообщений.
+    Слушает топик 'new_order' и его топики повторов, отправляет задачи в Celery.
+    """
+    logger.info(f"Подключение к Kafka: {KAFKA_SERVERS}, потребителей: {WORKERS}")
+    start_http_server(METRICS_PORT)
+    producer = AIOKafkaProducer(bootstrap_servers=KAFKA_SERVERS)
+    await producer.start()
+    try:
+        workers = [backpressure.run()]
+        workers += [
+            run_worker(f"main-{worker_id}", NEW_ORDER_TOPIC, GROUP_ID, producer)
+            for worker_id in range(WORKERS)
+        ]
+        # У каждой ступени своя группа: ожидание в ней не задерживает остальные
+        workers += [
+            run_worker(f"retry-{delay}s", topic, f"{GROUP_ID}.{topic}", producer, delay)
+            for topic, delay in RETRY_TOPICS
+        ]
+        await asyncio.gather(*workers)
+    finally:
+        await producer.stop()
 
-            except json.JSONDecodeError as e:
-                logger.error(f"Ошибка при разборе JSON: {e}, сообщение: {msg.value}")
-            except Exception as e:
-                logger.error(f"Ошибка при обработке сообщения: {e}")
 
-    except Exception as e:
-        logger.error(f"Ошибка потребителя Kafka: {e}")
-        raise
+async def replay(limit: int | None, dry_run: bool):
+    """Возврат сообщений из DLQ в new_order с обнулённым счётчиком попыток"""
+    consumer = AIOKafkaConsumer(
+        DLQ_TOPIC,
+        bootstrap_servers=KAFKA_SERVERS,
+        group_id=f"{GROUP_ID}.dlq-replay",
+        auto_offset_reset="earliest",
+        enable_auto_commit=False,
+    )
+    producer = AIOKafkaProducer(bootstrap_servers=KAFKA_SERVERS)
+    await consumer.start()
+    await producer.start()
+    replayed = 0
+    try:
+        while limit is None or replayed < limit:
+            batches = await consumer.getmany(timeout_ms=5000, max_records=MAX_RECORDS)
+            if not batches:
+                break
+            for tp, messages in batches.items():
+                for msg in messages:
+                    if limit is not None and replayed >= limit:
+                        break
+                    print(
+                        f"{tp.partition}:{msg.offset} attempt="
+                        f"{get_header(msg, 'attempt')} "
+                        f"error={get_header(msg, 'error')} value={msg.value!r}"
+                    )
+                    if not dry_run:
+                        await producer.send_and_wait(
+                            NEW_ORDER_TOPIC,
+                            msg.value,
+                            key=msg.key,
+                            headers=[("replayed_from", DLQ_TOPIC.encode())],
+                        )
+                        await consumer.commit({tp: msg.offset + 1})
+                    replayed += 1
+            if dry_run:
+                # Без коммита getmany вернул бы те же сообщения повторно
+                break
     finally:
+        await producer.stop()
         await consumer.stop()
-        logger.info("Потребитель Kafka остановлен")
+    logger.info(f"Сообщений из DLQ: {replayed}, dry_run={dry_run}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kafka consumer for new orders")
+    subparsers = parser.add_subparsers(dest="command")
+    replay_parser = subparsers.add_parser("replay", help="Replay messages from DLQ")
+    replay_parser.add_argument("--limit", type=int, default=None)
+    replay_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        asyncio.run(replay(args.limit, args.dry_run))
+    else:
+        asyncio.run(consume())
 
 
 if __name__ == "__main__":
-    asyncio.run(consume())
+    main()
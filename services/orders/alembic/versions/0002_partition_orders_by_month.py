@@ -0,0 +1,96 @@
+"""Partition orders table by month on created_at
+
+Revision ID: 0002_partition_orders_by_month
+Revises: 0001_create_orders_fixed
+Create Date: 2026-10-19 10:00:00.000000
+"""
+
+from alembic import op
+
+# revision identifiers
+revision = "0002_partition_orders_by_month"
+down_revision = "0001_create_orders_fixed"
+branch_labels = None
+depends_on = None
+
+# Сколько будущих месяцев создаётся сразу (дальше - задача maintain_partitions)
+PREMAKE_MONTHS = 3
+
+
+def upgrade():
+    # Старая таблица переименовывается вместе с индексами, чтобы освободить имена
+    op.execute("ALTER TABLE orders RENAME TO orders_unpartitioned")
+    op.execute(
+        "ALTER TABLE orders_unpartitioned "
+        "RENAME CONSTRAINT orders_pkey TO orders_unpartitioned_pkey"
+    )
+    op.execute(
+        "ALTER INDEX IF EXISTS ix_orders_user_id "
+        "RENAME TO ix_orders_unpartitioned_user_id"
+    )
+
+    # LIKE сохраняет типы колонок (JSON или JSONB в зависимости от того,
+    # кто создавал таблицу - миграция 0001 или entrypoint) и значения по умолчанию.
+    # Ключ секционирования обязан входить в первичный ключ.
+    op.execute("""
+        CREATE TABLE orders (
+            LIKE orders_unpartitioned INCLUDING DEFAULTS,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(
+        "CREATE INDEX ix_orders_user_id_created_at ON orders (user_id, created_at)"
+    )
+
+    # Секции от месяца самого старого заказа до текущего + PREMAKE_MONTHS
+    op.execute(f"""
+        DO $$
+        DECLARE
+            first_month date;
+            last_month date := date_trunc('month', now() AT TIME ZONE 'UTC')::date
+                               + interval '{PREMAKE_MONTHS} months';
+            m date;
+        BEGIN
+            SELECT date_trunc('month', min(created_at) AT TIME ZONE 'UTC')::date
+              INTO first_month FROM orders_unpartitioned;
+            first_month := least(
+                coalesce(first_month, last_month),
+                date_trunc('month', now() AT TIME ZONE 'UTC')::date
+            );
+            m := first_month;
+            WHILE m <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF orders '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'orders_p' || to_char(m, 'YYYY_MM'),
+                    m::text || ' 00:00:00+00',
+                    (m + interval '1 month')::date::text || ' 00:00:00+00'
+                );
+                m := (m + interval '1 month')::date;
+            END LOOP;
+        END
+        $$;
+    """)
+    # Страховка от вставки вне созданных диапазонов
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+
+    op.execute("INSERT INTO orders SELECT * FROM orders_unpartitioned")
+    op.execute("DROP TABLE orders_unpartitioned")
+
+
+def downgrade():
+    op.execute("ALTER TABLE orders RENAME TO orders_partitioned")
+    op.execute(
+        "ALTER TABLE orders_partitioned "
+        "RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey"
+    )
+    op.execute("""
+        CREATE TABLE orders (
+            LIKE orders_partitioned INCLUDING DEFAULTS,
+            PRIMARY KEY (id)
+        )
+    """)
+    op.execute("CREATE INDEX ix_orders_user_id ON orders (user_id)")
+    op.execute("INSERT INTO orders SELECT * FROM orders_partitioned")
+    # Удаление родителя удаляет и все присоединённые секции
+    op.execute("DROP TABLE orders_partitioned")
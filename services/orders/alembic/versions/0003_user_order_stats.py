@@ -0,0 +1,40 @@
+"""Create user_order_stats summary table
+
+Revision ID: 0003_user_order_stats
+Revises: 0002_partition_orders_by_month
+Create Date: 2026-10-19 12:00:00.000000
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers
+revision = "0003_user_order_stats"
+down_revision = "0002_partition_orders_by_month"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    counter = dict(nullable=False, server_default=sa.text("0"))
+    op.create_table(
+        "user_order_stats",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("order_count", sa.Integer(), **counter),
+        sa.Column("total_spent", sa.Float(), **counter),
+        sa.Column("pending_count", sa.Integer(), **counter),
+        sa.Column("paid_count", sa.Integer(), **counter),
+        sa.Column("shipped_count", sa.Integer(), **counter),
+        sa.Column("canceled_count", sa.Integer(), **counter),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+    # Заполнение по существующим заказам: python -m app.stats backfill
+
+
+def downgrade():
+    op.drop_table("user_order_stats")
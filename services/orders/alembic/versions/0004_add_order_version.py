@@ -0,0 +1,26 @@
+"""Add version column to orders
+
+Revision ID: 0004_add_order_version
+Revises: 0003_user_order_stats
+Create Date: 2026-10-19 14:00:00.000000
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers
+revision = "0004_add_order_version"
+down_revision = "0003_user_order_stats"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "orders",
+        sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("1")),
+    )
+
+
+def downgrade():
+    op.drop_column("orders", "version")
@@ -0,0 +1,80 @@
+"""Drop the default partition of orders
+
+Revision ID: 0005_drop_orders_default_partition
+Revises: 0004_add_order_version
+Create Date: 2026-10-20 10:00:00.000000
+
+Строки в DEFAULT-секции блокируют создание секции за их месяц, а при наличии
+DEFAULT-секции недоступен DETACH PARTITION ... CONCURRENTLY. Строки переносятся
+в месячные секции (недостающие создаются), DEFAULT-секция удаляется.
+Без неё вставка в месяц без секции падает, поэтому секции на текущий и
+PREMAKE_MONTHS следующих месяцев создаются сразу (дальше - maintain_partitions).
+
+Заодно удаляется индекс ix_orders_user_id, который entrypoint создавал
+поверх (user_id, created_at) при каждом старте.
+"""
+
+from alembic import op
+
+# revision identifiers
+revision = "0005_drop_orders_default_partition"
+down_revision = "0004_add_order_version"
+branch_labels = None
+depends_on = None
+
+PREMAKE_MONTHS = 3
+
+
+def upgrade():
+    op.execute("ALTER TABLE orders DETACH PARTITION orders_default")
+    op.execute("""
+        DO $$
+        DECLARE
+            m date;
+        BEGIN
+            FOR m IN
+                SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date
+                FROM orders_default
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF orders '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'orders_p' || to_char(m, 'YYYY_MM'),
+                    m::text || ' 00:00:00+00',
+                    (m + interval '1 month')::date::text || ' 00:00:00+00'
+                );
+            END LOOP;
+        END
+        $$;
+    """)
+    op.execute("INSERT INTO orders SELECT * FROM orders_default")
+    op.execute("DROP TABLE orders_default")
+    op.execute(f"""
+        DO $$
+        DECLARE
+            m date;
+        BEGIN
+            FOR m IN
+                SELECT generate_series(
+                    date_trunc('month', now() AT TIME ZONE 'UTC'),
+                    date_trunc('month', now() AT TIME ZONE 'UTC')
+                        + interval '{PREMAKE_MONTHS} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF orders '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'orders_p' || to_char(m, 'YYYY_MM'),
+                    m::text || ' 00:00:00+00',
+                    (m + interval '1 month')::date::text || ' 00:00:00+00'
+                );
+            END LOOP;
+        END
+        $$;
+    """)
+    op.execute("DROP INDEX IF EXISTS ix_orders_user_id")
+
+
+def downgrade():
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
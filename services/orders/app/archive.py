@@ -0,0 +1,397 @@
+"""
+Архивирование завершённых заказов (SHIPPED, CANCELED) в Parquet.
+
+Заказы старше archive_after_days пачками переносятся из orders в файлы
+{archive_uri}/month=YYYY-MM/orders-<uuid>.parquet и удаляются из таблицы.
+Хранилище выбирается схемой archive_uri через pyarrow.fs: file://, s3://, gs://.
+
+Рядом лежит индекс order_id -> файл, разбитый на INDEX_SHARDS секций по
+первому символу id: {archive_uri}/_index/shard=<x>/part-<uuid>.parquet.
+Поиск заказа читает одну секцию, а не весь архив.
+
+Запуск вручную:
+    python -m app.archive                  # перенести подходящие заказы
+    python -m app.archive --dry-run        # только посчитать, сколько их
+    python -m app.archive --rebuild-index  # пересобрать индекс по файлам архива
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs as pafs
+from sqlalchemy import delete, func, select, update
+
+from . import models
+from .cache import CustomJSONEncoder, redis_client
+from .config import settings
+from .database import engine
+from .resilience import redis_breaker
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_STATUSES = [models.OrderStatus.SHIPPED, models.OrderStatus.CANCELED]
+
+ARCHIVE_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("user_id", pa.int64()),
+        # Состав заказа произвольный, поэтому хранится строкой JSON
+        ("items", pa.string()),
+        ("total_price", pa.float64()),
+        ("status", pa.string()),
+        ("version", pa.int64()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ]
+)
+
+INDEX_SCHEMA = pa.schema([("id", pa.string()), ("path", pa.string())])
+INDEX_DIR = "_index"
+INDEX_SHARDS = "0123456789abcdef"
+# Увеличивается после каждой пачки архивации: процессы сбрасывают
+# закешированный индекс
+INDEX_VERSION_KEY = "archive:index_version"
+# Компактизацию секций выполняет один запуск за раз
+INDEX_COMPACTION_LOCK = "archive:index_compaction"
+INDEX_COMPACTION_LOCK_SECONDS = 600
+
+
+def get_filesystem() -> tuple[pafs.FileSystem, str]:
+    return pafs.FileSystem.from_uri(settings.archive_uri)
+
+
+def _to_table(rows) -> pa.Table:
+    return pa.Table.from_pylist(
+        [
+            {
+                "id": str(row.id),
+                "user_id": row.user_id,
+                "items": json.dumps(row.items, cls=CustomJSONEncoder),
+                "total_price": row.total_price,
+                "status": row.status.value,
+                "version": row.version,
+                "created_at": row.created_at,
+            }
+            for row in rows
+        ],
+        schema=ARCHIVE_SCHEMA,
+    )
+
+
+def write_batch(filesystem: pafs.FileSystem, root: str, rows) -> dict[str, str]:
+    """Пишет пачку в файлы по месяцам, возвращает order_id -> путь файла"""
+    by_month = defaultdict(list)
+    for row in rows:
+        by_month[row.created_at.strftime("%Y-%m")].append(row)
+
+    paths = {}
+    for month, month_rows in sorted(by_month.items()):
+        directory = f"{root}/month={month}"
+        filesystem.create_dir(directory, recursive=True)
+        path = f"{directory}/orders-{uuid.uuid4().hex}.parquet"
+        pq.write_table(_to_table(month_rows), path, filesystem=filesystem)
+        paths.update((str(row.id), path) for row in month_rows)
+    return paths
+
+
+def index_shard(order_id: str) -> str:
+    return order_id[0]
+
+
+def _shard_dir(root: str, shard: str) -> str:
+    return f"{root}/{INDEX_DIR}/shard={shard}"
+
+
+def _parquet_files(filesystem: pafs.FileSystem, directory: str, recursive=False):
+    selector = pafs.FileSelector(directory, recursive=recursive, allow_not_found=True)
+    return [
+        info.path
+        for info in filesystem.get_file_info(selector)
+        if info.type == pafs.FileType.File and info.path.endswith(".parquet")
+    ]
+
+
+def write_index(filesystem: pafs.FileSystem, root: str, paths: dict) -> set[str]:
+    """Дописывает order_id -> файл в секции индекса, возвращает затронутые секции"""
+    by_shard = defaultdict(list)
+    for order_id, path in paths.items():
+        by_shard[index_shard(order_id)].append((order_id, path))
+    for shard, entries in by_shard.items():
+        directory = _shard_dir(root, shard)
+        filesystem.create_dir(directory, recursive=True)
+        table = pa.Table.from_pylist(
+            [{"id": order_id, "path": path} for order_id, path in entries],
+            schema=INDEX_SCHEMA,
+        )
+        pq.write_table(
+            table,
+            f"{directory}/part-{uuid.uuid4().hex}.parquet",
+            filesystem=filesystem,
+        )
+    return set(by_shard)
+
+
+def read_index_shard(filesystem: pafs.FileSystem, root: str, shard: str) -> dict:
+    paths = {}
+    for part in _parquet_files(filesystem, _shard_dir(root, shard)):
+        table = pq.read_table(part, filesystem=filesystem, partitioning=None)
+        paths.update(
+            zip(table.column("id").to_pylist(), table.column("path").to_pylist())
+        )
+    return paths
+
+
+def compact_index_shard(filesystem: pafs.FileSystem, root: str, shard: str):
+    """Сливает части секции в один файл, чтобы поиск читал один файл"""
+    parts = _parquet_files(filesystem, _shard_dir(root, shard))
+    if len(parts) <= 1:
+        return
+    table = pa.concat_tables(
+        pq.read_table(part, filesystem=filesystem, partitioning=None) for part in parts
+    ).sort_by("id")
+    # Сначала новый файл, потом удаление старых: читатель видит дубли, но не пропуски
+    pq.write_table(
+        table,
+        f"{_shard_dir(root, shard)}/part-{uuid.uuid4().hex}.parquet",
+        filesystem=filesystem,
+    )
+    for part in parts:
+        filesystem.delete_file(part)
+
+
+def compact_index_shards(filesystem: pafs.FileSystem, root: str, shards):
+    """
+    Компактизация под блокировкой в Redis: два одновременных запуска прочитали
+    бы одни и те же части и оба удалили их. Если блокировку взять не удалось
+    (Redis недоступен, идёт другой запуск), части остаются до следующего запуска.
+    """
+    lock = redis_client.lock(
+        INDEX_COMPACTION_LOCK, timeout=INDEX_COMPACTION_LOCK_SECONDS
+    )
+    try:
+        acquired = redis_breaker.call(lock.acquire, blocking=False)
+    except Exception as e:
+        logger.warning(f"Archive index compaction skipped: {e}")
+        return
+    if not acquired:
+        logger.info("Archive index compaction skipped: another run holds the lock")
+        return
+    try:
+        for shard in sorted(shards):
+            compact_index_shard(filesystem, root, shard)
+    finally:
+        try:
+            lock.release()
+        except Exception as e:
+            logger.warning(f"Failed to release archive index compaction lock: {e}")
+
+
+def bump_index_version():
+    try:
+        redis_breaker.call(redis_client.incr, INDEX_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Failed to bump archive index version: {e}")
+
+
+def rebuild_index() -> dict:
+    """Индекс заново по всем файлам архива (для архивов без индекса)"""
+    filesystem, root = get_filesystem()
+    filesystem.delete_dir_contents(f"{root}/{INDEX_DIR}", missing_dir_ok=True)
+    indexed = 0
+    for path in _parquet_files(filesystem, root, recursive=True):
+        if f"/{INDEX_DIR}/" in path:
+            continue
+        table = pq.read_table(path, columns=["id"], filesystem=filesystem)
+        ids = table.column("id").to_pylist()
+        write_index(filesystem, root, dict.fromkeys(ids, path))
+        indexed += len(ids)
+    compact_index_shards(filesystem, root, INDEX_SHARDS)
+    bump_index_version()
+    return {"indexed": indexed}
+
+
+def archive_orders(
+    older_than_days: int | None = None,
+    batch_size: int | None = None,
+    dry_run: bool = False,
+) -> dict:
+    if older_than_days is None:
+        older_than_days = settings.archive_after_days
+    if batch_size is None:
+        batch_size = settings.archive_batch_size
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+
+    orders = models.Order.__table__
+    candidates = (
+        orders.c.status.in_(ARCHIVED_STATUSES),
+        orders.c.created_at < cutoff,
+    )
+
+    if dry_run:
+        with engine.connect() as conn:
+            count = conn.scalar(select(func.count()).where(*candidates))
+        return {"archived": 0, "candidates": count, "files": 0, "dry_run": True}
+
+    filesystem, root = get_filesystem()
+    archived = 0
+    files = 0
+    shards = set()
+    while True:
+        # Файл пишется внутри транзакции: строки удаляются, только если
+        # запись удалась. Сбой после записи оставит дубль в архиве, но не потерю
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(orders)
+                .where(*candidates)
+                .order_by(orders.c.created_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                break
+
+            paths = write_batch(filesystem, root, rows)
+            shards |= write_index(filesystem, root, paths)
+            files += len(set(paths.values()))
+            conn.execute(
+                delete(orders).where(
+                    orders.c.id.in_([row.id for row in rows]),
+                    orders.c.created_at.between(
+                        rows[0].created_at, rows[-1].created_at
+                    ),
+                )
+            )
+            # Меняет ETag списка заказов затронутых пользователей
+            stats = models.UserOrderStats.__table__
+            conn.execute(
+                update(stats)
+                .where(stats.c.user_id.in_({row.user_id for row in rows}))
+                .values(updated_at=datetime.now(timezone.utc))
+            )
+        # Строки пачки уже удалены из БД - читатели должны сразу увидеть индекс
+        bump_index_version()
+        archived += len(rows)
+        logger.info(f"Archived batch of {len(rows)} orders, total={archived}")
+
+    compact_index_shards(filesystem, root, shards)
+    return {"archived": archived, "files": files, "dry_run": False}
+
+
+class ArchiveIndex:
+    """
+    Секции индекса order_id -> файл архива в памяти процесса: не больше
+    archive_index_max_shards секций (LRU), каждая не дольше
+    archive_index_ttl_seconds. После каждой пачки архивации задача увеличивает
+    версию индекса в Redis, и закешированные секции сбрасываются сразу. Без Redis
+    промах по секции перечитывает её (не чаще archive_index_miss_reload_seconds),
+    а не ждёт TTL.
+    Загрузка блокирующая - вызывать из потока (см. find_archived_order).
+    """
+
+    def __init__(self):
+        self._shards: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._version: str | None = None
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        try:
+            version = redis_breaker.call(redis_client.get, INDEX_VERSION_KEY)
+        except Exception as e:
+            # Без Redis секции обновятся по TTL
+            logger.warning(f"Archive index version check skipped: {e}")
+            return
+        if version != self._version:
+            self._shards.clear()
+            self._version = version
+
+    def _load(self, shard: str, now: float) -> dict:
+        filesystem, root = get_filesystem()
+        paths = read_index_shard(filesystem, root, shard)
+        self._shards[shard] = (now, paths)
+        logger.info(f"Archive index shard {shard} loaded: {len(paths)}")
+        return paths
+
+    def find_path(self, order_id: str) -> Optional[str]:
+        shard = index_shard(order_id)
+        with self._lock:
+            self._check_version()
+            now = time.monotonic()
+            cached = self._shards.get(shard)
+            if cached is None or now - cached[0] > settings.archive_index_ttl_seconds:
+                path = self._load(shard, now).get(order_id)
+            else:
+                path = cached[1].get(order_id)
+                # Заказ мог попасть в архив после загрузки секции
+                if (
+                    path is None
+                    and now - cached[0] >= settings.archive_index_miss_reload_seconds
+                ):
+                    path = self._load(shard, now).get(order_id)
+            self._shards.move_to_end(shard)
+            while len(self._shards) > settings.archive_index_max_shards:
+                self._shards.popitem(last=False)
+            return path
+
+
+archive_index = ArchiveIndex()
+
+
+def find_archived_order(order_id: str) -> Optional[dict]:
+    """
+    Заказ из архива в формате schemas.Order или None.
+    Читает файлы синхронно: из async-кода - через asyncio.to_thread.
+    """
+    try:
+        order_id = str(uuid.UUID(order_id))
+    except ValueError:
+        return None
+    try:
+        path = archive_index.find_path(order_id)
+        if path is None:
+            return None
+        filesystem, _ = get_filesystem()
+        table = pq.read_table(
+            path, filesystem=filesystem, filters=[("id", "=", order_id)]
+        )
+    except (OSError, pa.ArrowException) as e:
+        logger.error(f"Failed to read order archive: {e}")
+        return None
+
+    rows = table.to_pylist()
+    if not rows:
+        return None
+    order = rows[0]
+    order["items"] = json.loads(order["items"])
+    return order
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive finished orders to Parquet")
+    parser.add_argument("--older-than-days", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--rebuild-index", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.rebuild_index:
+        print(rebuild_index())
+        return
+    result = archive_orders(
+        older_than_days=args.older_than_days,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
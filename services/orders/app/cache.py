@@ -1,13 +1,25 @@
 import json
+import logging
 from datetime import datetime
 from enum import Enum
+from typing import Optional, Tuple
 from uuid import UUID
 
 import redis
 
 from .config import settings
+from .resilience import redis_breaker
 
-redis_client = redis.Redis.from_url(settings.redis_url, decode_responses=True)
+logger = logging.getLogger(__name__)
+
+# Короткие таймауты: медленный Redis не должен растягивать запрос,
+# при ошибках кеш пропускается и данные читаются из БД
+redis_client = redis.Redis.from_url(
+    settings.redis_url,
+    decode_responses=True,
+    socket_timeout=settings.redis_socket_timeout_seconds,
+    socket_connect_timeout=settings.redis_socket_timeout_seconds,
+)
 
 
 class CustomJSONEncoder(json.JSONEncoder):
@@ -22,15 +34,83 @@ class CustomJSONEncoder(json.JSONEncoder):
 
 
 def get_cache(key: str):
-    data = redis_client.get(key)
+    try:
+        data = redis_breaker.call(redis_client.get, key)
+    except Exception as e:
+        logger.warning(f"Cache read skipped for {key}: {e}")
+        return None
     if data:
         return json.loads(data)
     return None
 
 
 def set_cache(key: str, value: dict, ttl: int = 300):
-    redis_client.setex(key, ttl, json.dumps(value, cls=CustomJSONEncoder))
+    try:
+        redis_breaker.call(
+            redis_client.setex, key, ttl, json.dumps(value, cls=CustomJSONEncoder)
+        )
+    except Exception as e:
+        logger.warning(f"Cache write skipped for {key}: {e}")
 
 
 def delete_cache(key: str):
-    redis_client.delete(key)
+    try:
+        redis_breaker.call(redis_client.delete, key)
+    except Exception as e:
+        logger.warning(f"Cache delete failed for {key}: {e}")
+
+
+def order_meta_key(order_id) -> str:
+    return f"order_meta:{order_id}"
+
+
+# Запись заказа и метаданных, только если в кеше нет более новой версии:
+# PATCH и Celery пишут без порядка, и запоздавшая запись не должна вернуть
+# старый заказ со старым ETag
+_CACHE_ORDER = redis_client.register_script("""
+local current = redis.call('GET', KEYS[2])
+if current then
+    local version = tonumber(string.match(current, ':(%d+)$'))
+    if version and version > tonumber(ARGV[3]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[4])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[4])
+return 1
+""")
+
+
+def cache_order(order_dict: dict, ttl: int = 300):
+    """
+    Кеширует заказ целиком (order:{id}) и его метаданные (order_meta:{id}):
+    владельца и версию, по которым GET отвечает 304 без чтения самого заказа.
+    Более новая версия в кеше не перезаписывается.
+    """
+    order_id = order_dict["id"]
+    version = order_dict["version"]
+    try:
+        redis_breaker.call(
+            _CACHE_ORDER,
+            keys=[f"order:{order_id}", order_meta_key(order_id)],
+            args=[
+                json.dumps(order_dict, cls=CustomJSONEncoder),
+                f"{order_dict['user_id']}:{version}",
+                version,
+                ttl,
+            ],
+        )
+    except Exception as e:
+        logger.warning(f"Cache write skipped for order {order_id}: {e}")
+
+
+def get_order_meta(order_id) -> Optional[Tuple[int, int]]:
+    try:
+        data = redis_breaker.call(redis_client.get, order_meta_key(order_id))
+    except Exception as e:
+        logger.warning(f"Order meta read skipped for {order_id}: {e}")
+        return None
+    if not data:
+        return None
+    user_id, version = data.split(":", 1)
+    return int(user_id), int(version)
@@ -0,0 +1,135 @@
+"""
+Адаптивное ограничение параллельных запросов (load shedding).
+
+Лимит подбирается по наблюдаемой задержке (AIMD): пока время до начала ответа
+ниже concurrency_target_latency_ms, лимит медленно растёт (+1 за «круг»
+запросов), при превышении или 5xx - уменьшается в concurrency_backoff раз,
+не чаще раза за целевую задержку. Запросы сверх лимита сразу получают 503
+с Retry-After, а не ждут в очереди к пулу БД.
+
+Приоритеты: чтение может занять весь лимит, запись (создание и изменение
+заказов) - только долю concurrency_write_share. /health* и SSE не ограничиваются.
+Слот освобождается с началом ответа: потоковый экспорт не занимает его на всё
+время отправки тела.
+"""
+
+import logging
+import time
+
+from starlette.responses import JSONResponse
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+EXEMPT = "exempt"
+READ = "read"
+WRITE = "write"
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def classify(scope) -> str:
+    path = scope["path"]
+    # SSE держит соединение часами - его нельзя считать обычным запросом
+    if path.startswith("/health") or path.endswith("/events"):
+        return EXEMPT
+    return READ if scope["method"] in READ_METHODS else WRITE
+
+
+class AdaptiveConcurrencyLimiter:
+    """Состояние меняется только из event loop, поэтому блокировки не нужны"""
+
+    def __init__(self):
+        self.limit = float(settings.concurrency_initial_limit)
+        self.inflight = 0
+        self.shed = 0
+        self._last_decrease = 0.0
+
+    def try_acquire(self, priority: str) -> bool:
+        capacity = self.limit
+        if priority == WRITE:
+            capacity *= settings.concurrency_write_share
+        if self.inflight >= max(1, int(capacity)):
+            self.shed += 1
+            return False
+        self.inflight += 1
+        return True
+
+    def release(self):
+        self.inflight -= 1
+
+    def on_sample(self, latency_seconds: float, failed: bool):
+        target = settings.concurrency_target_latency_ms / 1000
+        if failed or latency_seconds > target:
+            now = time.monotonic()
+            # Одна медленная волна запросов - одно уменьшение, а не по разу на каждый
+            if now - self._last_decrease >= target:
+                self.limit = max(
+                    settings.concurrency_min_limit,
+                    self.limit * settings.concurrency_backoff,
+                )
+                self._last_decrease = now
+        else:
+            self.limit = min(
+                settings.concurrency_max_limit, self.limit + 1 / self.limit
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "shed_total": self.shed,
+        }
+
+
+concurrency_limiter = AdaptiveConcurrencyLimiter()
+
+
+class ConcurrencyLimitMiddleware:
+    def __init__(self, app, limiter: AdaptiveConcurrencyLimiter = concurrency_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.concurrency_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+        priority = classify(scope)
+        if priority == EXEMPT:
+            await self.app(scope, receive, send)
+            return
+
+        if not self.limiter.try_acquire(priority):
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Service is overloaded, try again later"},
+                headers={"Retry-After": str(settings.concurrency_retry_after_seconds)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sampled = False
+
+        async def send_wrapper(message):
+            nonlocal sampled
+            # Задержка и слот - до начала ответа: у потоковых ответов (экспорт)
+            # длительность тела говорит о размере данных, а не о перегрузке
+            if message["type"] == "http.response.start" and not sampled:
+                sampled = True
+                self.limiter.release()
+                self.limiter.on_sample(
+                    time.perf_counter() - started, message["status"] >= 500
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not sampled:
+                self.limiter.on_sample(time.perf_counter() - started, True)
+            raise
+        finally:
+            if not sampled:
+                self.limiter.release()
@@ -1,8 +1,12 @@
 import os
 from pathlib import Path
+from typing import Literal, Optional
 
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
+SUPPORTED_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+
 
 class Settings(BaseSettings):
     postgres_orders_host: str = "postgres_orders"
@@ -11,16 +15,125 @@ class Settings(BaseSettings):
     postgres_orders_user: str = "postgres"
     postgres_orders_password: str = "orders_password_change_in_prod_456"
 
+    # Алгоритм access token от Auth Service: RS256, ES256 или EdDSA
     algorithm: str = "RS256"
+    # Ротация ключа или смена алгоритма в Auth: токены, подписанные прежним
+    # ключом, принимаются до истечения их срока жизни (ключи различаются по kid).
+    # Пусто - проверяется только текущий ключ. Алгоритм прежнего ключа
+    # определяется по типу ключа; previous_algorithm - необязательная сверка
+    previous_algorithm: str = ""
+    previous_public_key_path: str = ""
     kafka_bootstrap_servers: str = "kafka:29092"
+    # Топик новых заказов: число секций ограничивает число параллельных
+    # потребителей группы. Ключ сообщения - order_id или user_id
+    new_order_topic: str = "new_order"
+    new_order_topic_partitions: int = 6
+    new_order_partition_key: Literal["order_id", "user_id"] = "order_id"
+    kafka_replication_factor: int = 1
+    # Ступени повторов (топики new_order.retry.<ступень>) и топик new_order.dlq
+    new_order_retry_tiers: str = "10s,1m"
     redis_url: str = "redis://redis:6379/0"
     redis_limiter_url: str = "redis://redis:6379/2"  # Отдельная БД для rate limiter
     celery_broker_url: str = "redis://redis:6379/0"
     celery_result_backend: str = "redis://redis:6379/1"
 
+    # Таймауты и circuit breaker для Redis и Kafka на пути запроса
+    redis_socket_timeout_seconds: float = 0.25
+    kafka_send_timeout_seconds: float = 1.0
+    breaker_failure_threshold: int = 5
+    breaker_recovery_seconds: float = 10
+    # Сколько событий new_order держать в памяти, пока Kafka недоступна
+    kafka_pending_max: int = 10000
+    kafka_pending_flush_interval_seconds: float = 1.0
+    # Сколько при остановке ждать досылки отложенных событий
+    kafka_shutdown_drain_seconds: float = 5.0
+    # Отправка упавшего заказа на ступень повторов из Celery (вне пути запроса)
+    kafka_failure_publish_timeout_seconds: float = 10.0
+
+    # Адаптивный лимит параллельных запросов (AIMD по задержке до ответа)
+    concurrency_limit_enabled: bool = True
+    concurrency_initial_limit: int = 50
+    concurrency_min_limit: int = 5
+    concurrency_max_limit: int = 500
+    concurrency_target_latency_ms: int = 250
+    concurrency_backoff: float = 0.9
+    # Доля лимита, доступная запросам записи: чтения имеют приоритет
+    concurrency_write_share: float = 0.7
+    concurrency_retry_after_seconds: int = 1
+
+    # Readiness: фоновые проверки зависимостей и какие из них обязательны
+    readiness_check_interval_seconds: float = 5
+    readiness_check_timeout_seconds: float = 2
+    readiness_required_checks: str = "database,migrations"
+
+    # Профилирование запросов: по заголовку X-Profile с этим токеном (пусто -
+    # выключено) и/или случайная доля запросов. Движок: pyinstrument или cprofile
+    profiling_token: str = ""
+    profiling_header: str = "X-Profile"
+    profiling_sample_rate: float = 0.0
+    profiling_engine: Literal["pyinstrument", "cprofile"] = "pyinstrument"
+    profiling_dir: str = "/tmp/profiles"
+    server_timing_enabled: bool = True
+
+    # Инструментирование SQL: порог медленного оператора, число повторов одного
+    # отпечатка за HTTP-запрос для предупреждения (0 - выключено), размер реестра
+    sql_slow_query_ms: float = 200
+    sql_repeated_query_threshold: int = 5
+    sql_stats_max_queries: int = 500
+
+    # Реплики для чтения: URL через запятую. Пусто - все запросы идут в primary
+    replica_urls: str = ""
+    # Сколько секунд после записи пользователь читает из primary (read-your-writes)
+    replica_read_your_writes_seconds: int = 5
+
+    # Секционирование orders по месяцам: сколько секций создавать заранее
+    # и через сколько месяцев отсоединять старые (0 - никогда)
+    partition_premake_months: int = 3
+    partition_retention_months: int = 0
+    # Readiness: секции на текущий и столько следующих месяцев должны существовать
+    partition_alert_months: int = 1
+
+    # Канал Redis pub/sub для событий смены статуса заказов (SSE)
+    order_events_channel: str = "order_events"
+    sse_heartbeat_seconds: int = 15
+    sse_queue_size: int = 100
+    # Размер пачки строк серверного курсора при экспорте заказов
+    export_batch_size: int = 1000
+
+    # Архив завершённых заказов в Parquet: file:///path, s3://bucket/prefix, ...
+    archive_uri: str = "file:///app/archive"
+    archive_after_days: int = 365
+    archive_batch_size: int = 5000
+    archive_index_ttl_seconds: int = 300
+    # Промах по закешированной секции перечитывает её не чаще этого интервала
+    archive_index_miss_reload_seconds: int = 5
+    # Сколько секций индекса архива (из 16) держать в памяти процесса
+    archive_index_max_shards: int = 4
+
+    # Idempotency-Key на POST /orders/: срок хранения ответа, срок захвата ключа
+    # незавершённым запросом и сколько повтор ждёт завершения первого
+    idempotency_ttl_seconds: int = 86400
+    idempotency_lock_ttl_seconds: int = 30
+    idempotency_wait_seconds: float = 10
+    idempotency_poll_interval_seconds: float = 0.1
+
     # Путь к публичному ключу для проверки JWT токенов
     public_key_path: str = "/app/keys/public.pem"
 
+    @property
+    def new_order_retry_topics(self) -> list[tuple[str, int]]:
+        """(топик, задержка в секундах) для каждой ступени повторов"""
+        units = {"s": 1, "m": 60, "h": 3600}
+        return [
+            (f"{self.new_order_topic}.retry.{tier}", int(tier[:-1]) * units[tier[-1]])
+            for tier in (t.strip() for t in self.new_order_retry_tiers.split(","))
+            if tier
+        ]
+
+    @property
+    def new_order_dlq_topic(self) -> str:
+        return f"{self.new_order_topic}.dlq"
+
     @property
     def postgres_orders_url(self) -> str:
         # Используем переменные окружения или значения по умолчанию
@@ -31,6 +144,10 @@ class Settings(BaseSettings):
         db = os.getenv("POSTGRES_ORDERS_DB", self.postgres_orders_db)
         return f"postgresql://{user}:{password}@{host}:{port}/{db}"
 
+    @property
+    def replica_url_list(self) -> list[str]:
+        return [url.strip() for url in self.replica_urls.split(",") if url.strip()]
+
     @property
     def public_key(self) -> str:
         # Читаем публичный ключ из файла
@@ -44,15 +161,37 @@ class Settings(BaseSettings):
             return self._generate_fallback_public_key()
         return key_path.read_text()
 
+    @property
+    def previous_public_key(self) -> Optional[str]:
+        if not self.previous_public_key_path:
+            return None
+        # Указанный, но отсутствующий файл - ошибка конфигурации: FileNotFoundError
+        return Path(self.previous_public_key_path).read_text()
+
+    @field_validator("algorithm", "previous_algorithm")
+    @classmethod
+    def check_algorithm(cls, value: str) -> str:
+        if value and value not in SUPPORTED_ALGORITHMS:
+            raise ValueError(
+                f"Unsupported JWT algorithm {value!r}, "
+                f"expected one of {', '.join(SUPPORTED_ALGORITHMS)}"
+            )
+        return value
+
     def _generate_fallback_public_key(self) -> str:
         """Генерирует тестовый публичный ключ для разработки"""
         from cryptography.hazmat.primitives import serialization
-        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-        )
+        if self.algorithm == "EdDSA":
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        elif self.algorithm == "ES256":
+            private_key = ec.generate_private_key(ec.SECP256R1())
+        else:
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048,
+            )
         public_key = private_key.public_key()
         return public_key.public_bytes(
             encoding=serialization.Encoding.PEM,
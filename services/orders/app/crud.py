@@ -1,6 +1,9 @@
 import uuid
-from typing import Union
+from datetime import datetime, timezone
+from typing import Optional, Union
 
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
 from . import models, schemas
@@ -14,31 +17,180 @@ def create_order(db: Session, order: schemas.OrderCreate, user_id: int):
         status=models.OrderStatus.PENDING,
     )
     db.add(db_order)
+    record_order_created(db, user_id, order.total_price)
     db.commit()
     db.refresh(db_order)
     return db_order
 
 
-def get_order(db: Session, order_id: Union[str, uuid.UUID]):
+def get_order(
+    db: Session,
+    order_id: Union[str, uuid.UUID],
+    created_at: Optional[datetime] = None,
+):
     # Преобразуем строку в UUID если необходимо
     if isinstance(order_id, str):
         try:
             order_id = uuid.UUID(order_id)
         except ValueError:
             return None
-    return db.query(models.Order).filter(models.Order.id == order_id).first()
+    query = db.query(models.Order).filter(models.Order.id == order_id)
+    # Если дата создания известна, планировщик читает только одну секцию
+    if created_at is not None:
+        query = query.filter(models.Order.created_at == created_at)
+    return query.first()
 
 
 def update_order_status(
-    db: Session, order_id: Union[str, uuid.UUID], status: models.OrderStatus
+    db: Session,
+    order_id: Union[str, uuid.UUID],
+    status: models.OrderStatus,
+    user_id: Optional[int] = None,
+    created_at: Optional[datetime] = None,
 ):
-    db_order = get_order(db, order_id)
-    if db_order:
-        db_order.status = status
-        db.commit()
-        db.refresh(db_order)
+    """
+    Условный переход статуса одним UPDATE ... RETURNING.
+    Строка меняется, только если текущий статус входит в allowed_from(status)
+    (и заказ принадлежит user_id, если он передан). Возвращает обновлённый
+    заказ или None: заказа нет, он чужой или переход недопустим.
+    С created_at поиск строки идёт в одной секции, а не во всех.
+    """
+    if isinstance(order_id, str):
+        try:
+            order_id = uuid.UUID(order_id)
+        except ValueError:
+            return None
+    allowed = models.allowed_from(status)
+    if not allowed:
+        return None
+
+    orders = models.Order.__table__
+    # Подзапрос блокирует строку и отдаёт прежний статус для сводки
+    previous = select(orders.c.id, orders.c.created_at, orders.c.status).where(
+        orders.c.id == order_id
+    )
+    if user_id is not None:
+        previous = previous.where(orders.c.user_id == user_id)
+    if created_at is not None:
+        previous = previous.where(orders.c.created_at == created_at)
+    previous = previous.with_for_update().subquery("previous")
+
+    stmt = (
+        update(models.Order)
+        .where(
+            models.Order.id == previous.c.id,
+            models.Order.created_at == previous.c.created_at,
+            models.Order.status.in_(allowed),
+        )
+        .values(status=status, version=models.Order.version + 1)
+        .returning(models.Order, previous.c.status)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    row = db.execute(stmt).first()
+    if row is None:
+        db.rollback()
+        return None
+
+    db_order, previous_status = row
+    record_status_changed(
+        db,
+        user_id=db_order.user_id,
+        total_price=db_order.total_price,
+        old_status=previous_status,
+        new_status=status,
+    )
+    # Отсоединяем до коммита: иначе commit пометит атрибуты устаревшими
+    # и первое обращение к ним снова сходит в БД
+    db.expunge(db_order)
+    db.commit()
     return db_order
 
 
-def get_orders_by_user(db: Session, user_id: int):
-    return db.query(models.Order).filter(models.Order.user_id == user_id).all()
+def get_orders_by_user(
+    db: Session,
+    user_id: int,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    # Фильтр по created_at позволяет отсечь ненужные месячные секции
+    query = db.query(models.Order).filter(models.Order.user_id == user_id)
+    if created_from is not None:
+        query = query.filter(models.Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.filter(models.Order.created_at < created_to)
+    return query.order_by(models.Order.created_at.desc()).all()
+
+
+def iter_orders_by_user(
+    db: Session,
+    user_id: int,
+    batch_size: int,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+):
+    """
+    Заказы пользователя пачками через серверный курсор (yield_per включает
+    stream_results): в памяти одновременно не больше batch_size строк.
+    Возвращаются строки Core без ORM-объектов.
+    """
+    orders = models.Order.__table__
+    query = select(*orders.c).where(orders.c.user_id == user_id)
+    if created_from is not None:
+        query = query.where(orders.c.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(orders.c.created_at < created_to)
+    query = query.order_by(orders.c.created_at).execution_options(yield_per=batch_size)
+    result = db.execute(query)
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def record_order_created(db: Session, user_id: int, total_price: float):
+    """Инкремент сводки в текущей транзакции; коммит делает вызывающий"""
+    stats = models.UserOrderStats.__table__
+    status_column = models.STATUS_COUNT_COLUMNS[models.OrderStatus.PENDING]
+    stmt = insert(stats).values(
+        user_id=user_id, order_count=1, total_spent=total_price, **{status_column: 1}
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stats.c.user_id],
+        set_={
+            "order_count": stats.c.order_count + 1,
+            "total_spent": stats.c.total_spent + total_price,
+            status_column: stats.c[status_column] + 1,
+            "updated_at": datetime.now(timezone.utc),
+        },
+    )
+    db.execute(stmt)
+
+
+def record_status_changed(
+    db: Session,
+    user_id: int,
+    total_price: float,
+    old_status: models.OrderStatus,
+    new_status: models.OrderStatus,
+):
+    """Перенос заказа между счётчиками статусов; коммит делает вызывающий"""
+    if old_status == new_status:
+        return
+    stats = models.UserOrderStats.__table__
+    old_column = models.STATUS_COUNT_COLUMNS[old_status]
+    new_column = models.STATUS_COUNT_COLUMNS[new_status]
+    values = {
+        old_column: stats.c[old_column] - 1,
+        new_column: stats.c[new_column] + 1,
+        "updated_at": datetime.now(timezone.utc),
+    }
+    # Отменённые заказы не входят в total_spent
+    if new_status == models.OrderStatus.CANCELED:
+        values["total_spent"] = stats.c.total_spent - total_price
+    elif old_status == models.OrderStatus.CANCELED:
+        values["total_spent"] = stats.c.total_spent + total_price
+    db.execute(update(stats).where(stats.c.user_id == user_id).values(**values))
+
+
+def get_user_order_stats(db: Session, user_id: int):
+    return db.get(models.UserOrderStats, user_id)
@@ -3,11 +3,24 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from .config import settings
+from .sql_stats import instrument_engine
 
 engine = create_engine(settings.postgres_orders_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Пул реплик только для чтения; запись всегда идёт в primary (engine)
+replica_engines = [
+    create_engine(url, pool_pre_ping=True) for url in settings.replica_url_list
+]
+ReplicaSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    for replica_engine in replica_engines
+]
+
+for db_engine in [engine, *replica_engines]:
+    instrument_engine(db_engine)
+
 
 def get_db():
     db = SessionLocal()
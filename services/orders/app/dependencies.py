@@ -4,7 +4,8 @@ import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
-from .config import settings
+from .keys import decode_token
+from .replicas import read_session_factory
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="http://localhost:8001/auth/token/")
 
@@ -16,13 +17,20 @@ def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> int:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        # Используем публичный ключ для проверки токена (RS256)
-        payload = jwt.decode(
-            token, settings.public_key, algorithms=[settings.algorithm]
-        )
+        # Проверяем подпись публичным ключом Auth (RS256 / ES256 / EdDSA)
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
         return int(user_id)
     except jwt.PyJWTError:
         raise credentials_exception
+
+
+def get_read_db(user_id: int = Depends(get_current_user)):
+    """Сессия для GET-запросов (см. read_session_factory)"""
+    db = read_session_factory(user_id)()
+    try:
+        yield db
+    finally:
+        db.close()
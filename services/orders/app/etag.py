@@ -0,0 +1,30 @@
+"""
+ETag и условные GET (If-None-Match) для чтения заказов.
+"""
+
+import hashlib
+from typing import Optional
+
+
+def order_etag(order_id, version: int) -> str:
+    return f'"{order_id}-{version}"'
+
+
+def user_orders_etag(user_id: int, stats, *params) -> str:
+    """
+    ETag списка заказов пользователя. Строка user_order_stats меняется
+    в той же транзакции, что и любой заказ пользователя, поэтому её
+    updated_at и счётчик служат версией всего списка.
+    """
+    raw = f"{user_id}|{stats.updated_at.isoformat()}|{stats.order_count}|{params}"
+    return f'"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Слабое сравнение: префикс W/ игнорируется
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
@@ -0,0 +1,107 @@
+"""
+События изменения статуса заказов через Redis pub/sub.
+
+Публикуют router (POST / PATCH) и Celery (process_order) в один канал.
+Каждая реплика сервиса держит одну подписку на этот канал и раздаёт
+события своим SSE-клиентам через очереди в памяти процесса.
+"""
+
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+
+import redis.asyncio as aioredis
+
+from .cache import CustomJSONEncoder, redis_client
+from .config import settings
+from .resilience import redis_breaker
+
+logger = logging.getLogger(__name__)
+
+
+def publish_order_status(order):
+    """Синхронная публикация: вызывается и из async-эндпоинтов, и из Celery"""
+    event = {
+        "order_id": order.id,
+        "user_id": order.user_id,
+        "status": order.status,
+    }
+    try:
+        redis_breaker.call(
+            redis_client.publish,
+            settings.order_events_channel,
+            json.dumps(event, cls=CustomJSONEncoder),
+        )
+    except Exception as e:
+        # Потеря события не должна ломать запись заказа: клиент догонит
+        # актуальный статус обычным GET после переподключения
+        logger.warning(f"Failed to publish status event for order {order.id}: {e}")
+
+
+class OrderEventBroadcaster:
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = {}
+        self._client: aioredis.Redis | None = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._client = aioredis.Redis.from_url(
+            settings.redis_url, decode_responses=True
+        )
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(settings.order_events_channel)
+                async for message in pubsub.listen():
+                    self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Order events subscription failed: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _dispatch(self, data: str):
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"Malformed order event: {data}")
+            return
+        for queue in self._subscribers.get(event.get("user_id"), ()):
+            if queue.full():
+                # Медленный клиент: отбрасываем самое старое событие
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.sse_queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+
+broadcaster = OrderEventBroadcaster()
@@ -0,0 +1,96 @@
+"""
+Потоковый экспорт заказов пользователя в NDJSON и CSV.
+
+Генераторы синхронные: StreamingResponse выполняет их в пуле потоков,
+поэтому чтение курсора не блокирует event loop. Сессия открывается внутри
+генератора - зависимость get_db закрылась бы до начала отправки тела.
+При обрыве соединения Starlette генератор не закрывает: вызывающий передаёт
+его close в BackgroundTask ответа, и курсор с соединением освобождаются сразу,
+а не при сборке мусора.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from . import crud
+from .cache import CustomJSONEncoder
+from .config import settings
+from .replicas import read_session_factory
+
+CSV_COLUMNS = [
+    "id",
+    "user_id",
+    "status",
+    "total_price",
+    "version",
+    "created_at",
+    "items",
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _encode_ndjson(batch) -> str:
+    return "".join(
+        json.dumps(row._asdict(), cls=CustomJSONEncoder) + "\n" for row in batch
+    )
+
+
+def _encode_csv(batch, writer, buffer: io.StringIO) -> str:
+    for row in batch:
+        order = row._asdict()
+        writer.writerow(
+            [
+                order["id"],
+                order["user_id"],
+                order["status"].value,
+                order["total_price"],
+                order["version"],
+                order["created_at"].isoformat(),
+                json.dumps(order["items"], cls=CustomJSONEncoder),
+            ]
+        )
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def stream_orders(
+    user_id: int,
+    fmt: str,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+) -> Iterator[str]:
+    """Один кусок ответа на каждую пачку курсора"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        # Заголовок уходит клиенту сразу, до первого запроса к БД
+        writer.writerow(CSV_COLUMNS)
+        yield _encode_csv((), writer, buffer)
+
+    db = read_session_factory(user_id)()
+    batches = crud.iter_orders_by_user(
+        db,
+        user_id,
+        batch_size=settings.export_batch_size,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    try:
+        for batch in batches:
+            if fmt == "csv":
+                yield _encode_csv(batch, writer, buffer)
+            else:
+                yield _encode_ndjson(batch)
+    finally:
+        # Серверный курсор, затем соединение с репликой
+        batches.close()
+        db.close()
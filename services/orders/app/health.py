@@ -0,0 +1,155 @@
+"""
+Liveness и readiness.
+
+Проверки БД, миграций, Redis и Kafka выполняет фоновая задача раз в
+readiness_check_interval_seconds, а /health/ready отдаёт последний результат
+из памяти: частые пробы со многих реплик не создают нагрузку на зависимости.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+
+from .cache import redis_client
+from .config import settings
+from .database import engine
+from .kafka import get_producer, pending_events
+from .partitions import add_months, list_partitions, month_start, partition_name
+from .resilience import OPEN, kafka_breaker
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_DIR = Path(__file__).resolve().parent.parent / "alembic"
+
+
+@lru_cache(maxsize=1)
+def expected_migration() -> str:
+    return ScriptDirectory(str(ALEMBIC_DIR)).get_current_head()
+
+
+def check_database() -> dict:
+    # Соединение берётся из пула, а не открывается заново
+    with engine.connect() as conn:
+        version = conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    return {"ok": True, "migration": version}
+
+
+def check_migrations(current: str | None) -> dict:
+    expected = expected_migration()
+    return {"ok": current == expected, "current": current, "expected": expected}
+
+
+def check_partitions() -> dict:
+    # DEFAULT-секции нет: вставка в месяц без секции падает. Пропуск задачи
+    # maintain_order_partitions виден заранее, пока секции ещё есть
+    with engine.connect() as conn:
+        existing = set(list_partitions(conn))
+    current = month_start(datetime.now(timezone.utc).date())
+    wanted = [
+        partition_name(add_months(current, offset))
+        for offset in range(settings.partition_alert_months + 1)
+    ]
+    missing = [name for name in wanted if name not in existing]
+    return {"ok": not missing, "missing": missing}
+
+
+def check_redis() -> dict:
+    redis_client.ping()
+    return {"ok": True}
+
+
+async def check_kafka() -> dict:
+    # Запрос метаданных топика проверяет, что producer запущен и брокер отвечает
+    await asyncio.wait_for(
+        get_producer().partitions_for(settings.new_order_topic),
+        settings.readiness_check_timeout_seconds,
+    )
+    return {
+        "ok": kafka_breaker.state != OPEN,
+        "breaker": kafka_breaker.state,
+        "pending_events": len(pending_events),
+    }
+
+
+async def _run_check(check, *args) -> dict:
+    try:
+        if asyncio.iscoroutinefunction(check):
+            return await check(*args)
+        return await asyncio.wait_for(
+            asyncio.to_thread(check, *args), settings.readiness_check_timeout_seconds
+        )
+    except Exception as e:
+        return {"ok": False, "error": repr(e)}
+
+
+class ReadinessChecker:
+    def __init__(self):
+        self._snapshot = {"status": "starting", "ready": False, "checks": {}}
+        self._checked_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        await self.check_once()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.readiness_check_interval_seconds)
+            try:
+                await self.check_once()
+            except Exception as e:
+                logger.error(f"Readiness check failed: {e}")
+
+    async def check_once(self):
+        database, partitions, redis_status, kafka_status = await asyncio.gather(
+            _run_check(check_database),
+            _run_check(check_partitions),
+            _run_check(check_redis),
+            _run_check(check_kafka),
+        )
+        checks = {
+            "database": database,
+            "migrations": check_migrations(database.get("migration")),
+            "partitions": partitions,
+            "redis": redis_status,
+            "kafka": kafka_status,
+        }
+        # Без Redis и Kafka сервис работает на запасных путях (см. resilience),
+        # поэтому по умолчанию они делают статус degraded, но не снимают трафик
+        required = settings.readiness_required_checks.split(",")
+        ready = all(
+            checks[name.strip()]["ok"] for name in required if name.strip() in checks
+        )
+        healthy = all(check["ok"] for check in checks.values())
+        self._snapshot = {
+            "status": "ok" if healthy else ("degraded" if ready else "unavailable"),
+            "ready": ready,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "checks": checks,
+        }
+        self._checked_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        # Зависшая фоновая задача не должна держать старый «ready»
+        stale_after = settings.readiness_check_interval_seconds * 3
+        if self._checked_at and time.monotonic() - self._checked_at > stale_after:
+            return {**self._snapshot, "status": "stale", "ready": False}
+        return self._snapshot
+
+
+readiness = ReadinessChecker()
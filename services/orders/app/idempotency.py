@@ -0,0 +1,129 @@
+"""
+Idempotency-Key для POST /orders/.
+
+Первый запрос с ключом захватывает его в Redis (SET NX EX) со статусом
+in_progress, после создания заказа на то же место записывается готовый ответ.
+Повторы с тем же ключом получают сохранённый ответ без записи в БД, события
+в Kafka и задачи Celery; пока первый запрос не завершён, повторы его ждут.
+Ключ действует в пределах пользователя.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Optional
+
+from fastapi import HTTPException, Response
+
+from .cache import redis_client
+from .config import settings
+from .resilience import redis_breaker
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+
+def idempotency_key(user_id: int, key: str) -> str:
+    return f"idempotency:{user_id}:{key}"
+
+
+def fingerprint(payload: str) -> str:
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def claim(user_id: int, key: str, request_fingerprint: str) -> Optional[dict]:
+    """
+    Захват ключа. None - ключ наш, запрос нужно выполнить.
+    Иначе - запись другого запроса с этим ключом.
+    """
+    record = {"state": IN_PROGRESS, "fingerprint": request_fingerprint}
+    try:
+        claimed = redis_breaker.call(
+            redis_client.set,
+            idempotency_key(user_id, key),
+            json.dumps(record),
+            nx=True,
+            ex=settings.idempotency_lock_ttl_seconds,
+        )
+        if claimed:
+            return None
+        data = redis_breaker.call(redis_client.get, idempotency_key(user_id, key))
+    except Exception as e:
+        # Без Redis защита от повторов недоступна, но создание заказа работает
+        logger.warning(f"Idempotency check failed, processing without it: {e}")
+        return None
+    # Ключ мог истечь между SET и GET - тогда повтор просто ждёт и перечитывает
+    return json.loads(data) if data else {"state": IN_PROGRESS}
+
+
+def store_response(
+    user_id: int, key: str, request_fingerprint: str, status_code: int, body: str
+):
+    record = {
+        "state": DONE,
+        "fingerprint": request_fingerprint,
+        "status_code": status_code,
+        "body": body,
+    }
+    try:
+        redis_breaker.call(
+            redis_client.set,
+            idempotency_key(user_id, key),
+            json.dumps(record),
+            ex=settings.idempotency_ttl_seconds,
+        )
+    except Exception as e:
+        logger.error(f"Failed to store idempotent response for key {key}: {e}")
+
+
+def release(user_id: int, key: str):
+    """Запрос упал до создания заказа: повтор должен выполниться заново"""
+    try:
+        redis_breaker.call(redis_client.delete, idempotency_key(user_id, key))
+    except Exception as e:
+        logger.error(f"Failed to release idempotency key {key}: {e}")
+
+
+async def replay(
+    user_id: int, key: str, request_fingerprint: str, record: dict
+) -> Response:
+    """Сохранённый ответ первого запроса; при необходимости ждёт его завершения"""
+    deadline = time.monotonic() + settings.idempotency_wait_seconds
+    while record.get("state") != DONE:
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+            )
+        await asyncio.sleep(settings.idempotency_poll_interval_seconds)
+        try:
+            data = redis_breaker.call(redis_client.get, idempotency_key(user_id, key))
+        except Exception as e:
+            raise HTTPException(
+                status_code=503,
+                detail="Idempotency storage is unavailable, retry later",
+                headers={"Retry-After": "1"},
+            ) from e
+        if data is None:
+            # Первый запрос упал и освободил ключ
+            raise HTTPException(
+                status_code=409,
+                detail="The original request with this Idempotency-Key failed, retry",
+            )
+        record = json.loads(data)
+
+    if record["fingerprint"] != request_fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request body",
+        )
+    return Response(
+        content=record["body"],
+        status_code=record["status_code"],
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
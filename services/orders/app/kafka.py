@@ -1,9 +1,20 @@
+import asyncio
 import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
 from uuid import UUID
 
 from aiokafka import AIOKafkaProducer
+from aiokafka.admin import AIOKafkaAdminClient, NewPartitions, NewTopic
 
 from .config import settings
+from .resilience import kafka_breaker
+
+logger = logging.getLogger(__name__)
 
 
 class CustomEncoder(json.JSONEncoder):
@@ -13,13 +24,295 @@ class CustomEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
-producer = AIOKafkaProducer(
-    bootstrap_servers=settings.kafka_bootstrap_servers,
-    value_serializer=lambda v: json.dumps(v, cls=CustomEncoder).encode("utf-8"),
-)
+def serialize_value(value) -> bytes:
+    return json.dumps(value, cls=CustomEncoder).encode("utf-8")
+
+
+def serialize_key(key) -> bytes:
+    return str(key).encode("utf-8")
+
+
+def _new_producer() -> AIOKafkaProducer:
+    # AIOKafkaProducer привязывается к event loop при создании -
+    # создавать только внутри работающего loop
+    return AIOKafkaProducer(
+        bootstrap_servers=settings.kafka_bootstrap_servers,
+        value_serializer=serialize_value,
+        key_serializer=serialize_key,
+    )
+
+
+# Producer пути запроса создаётся в lifespan, а не при импорте: модуль
+# импортируют и Celery, и мастер gunicorn (preload_app), где loop ещё нет
+_producer: AIOKafkaProducer | None = None
+
+
+def get_producer() -> AIOKafkaProducer:
+    if _producer is None:
+        raise RuntimeError("Kafka producer is not started")
+    return _producer
+
+
+async def _start_new_producer() -> AIOKafkaProducer:
+    producer = _new_producer()
+    try:
+        await producer.start()
+    except BaseException:
+        await producer.stop()
+        raise
+    return producer
+
+
+async def start_producer():
+    global _producer
+    _producer = await _start_new_producer()
+
+
+async def stop_producer():
+    global _producer
+    producer, _producer = _producer, None
+    if producer is not None:
+        await producer.stop()
+
+
+async def ensure_order_topics():
+    """
+    Создаёт топик new_order, его топики повторов и DLQ с
+    new_order_topic_partitions секциями или увеличивает их число
+    (уменьшить число секций в Kafka нельзя).
+    """
+    partitions = settings.new_order_topic_partitions
+    topics = [settings.new_order_topic, settings.new_order_dlq_topic] + [
+        topic for topic, _ in settings.new_order_retry_topics
+    ]
+    admin = AIOKafkaAdminClient(bootstrap_servers=settings.kafka_bootstrap_servers)
+    try:
+        await admin.start()
+        existing = await admin.list_topics()
+        missing = [topic for topic in topics if topic not in existing]
+        if missing:
+            await admin.create_topics(
+                [
+                    NewTopic(
+                        name=topic,
+                        num_partitions=partitions,
+                        replication_factor=settings.kafka_replication_factor,
+                    )
+                    for topic in missing
+                ]
+            )
+            logger.info(f"Kafka topics created: {missing}, partitions={partitions}")
+
+        grow = {}
+        for metadata in await admin.describe_topics(
+            [topic for topic in topics if topic in existing]
+        ):
+            if len(metadata["partitions"]) < partitions:
+                grow[metadata["topic"]] = NewPartitions(partitions)
+        if grow:
+            await admin.create_partitions(grow)
+            logger.info(f"Kafka topics partitions increased to {partitions}: {grow}")
+    except Exception as e:
+        # Топики может создать и сам брокер (auto.create.topics.enable)
+        logger.warning(f"Failed to ensure Kafka topics: {e}")
+    finally:
+        await admin.close()
+
+
+# События, не отправленные из-за недоступности Kafka. Заказ к этому моменту
+# уже создан, поэтому запрос не ждёт брокер, а событие дошлёт flush_pending_loop.
+# При переполнении теряются самые старые события (с записью в лог)
+pending_events: deque = deque()
+
+
+def _enqueue_pending(message: dict, key):
+    if len(pending_events) >= settings.kafka_pending_max:
+        dropped, _ = pending_events.popleft()
+        logger.error(f"Pending Kafka queue is full, event dropped: {dropped}")
+    pending_events.append((message, key))
+
 
+async def _send(message: dict, key):
+    await kafka_breaker.call_async(
+        get_producer().send_and_wait,
+        settings.new_order_topic,
+        message,
+        key=key,
+        timeout=settings.kafka_send_timeout_seconds,
+    )
 
-async def send_new_order(order_id):
+
+async def send_new_order(order_id, user_id: int, created_at: datetime | None = None):
     # Convert UUID to string if needed
     order_id_str = str(order_id) if isinstance(order_id, UUID) else order_id
-    await producer.send_and_wait("new_order", {"order_id": order_id_str})
+    # Ключ определяет секцию: события одного заказа (или пользователя)
+    # читаются по порядку одним потребителем группы
+    key = user_id if settings.new_order_partition_key == "user_id" else order_id_str
+    message = {"order_id": order_id_str, "user_id": user_id}
+    # По дате создания обработчик читает одну секцию orders, а не все
+    if created_at is not None:
+        message["created_at"] = created_at.isoformat()
+    # Пока есть недосланные события, новые встают за ними - порядок сохраняется
+    if pending_events:
+        _enqueue_pending(message, key)
+        return
+    try:
+        await _send(message, key)
+    except Exception as e:
+        logger.warning(f"Kafka publish deferred for order {order_id_str}: {e!r}")
+        _enqueue_pending(message, key)
+
+
+async def _flush_pending():
+    while pending_events:
+        message, key = pending_events[0]
+        try:
+            await _send(message, key)
+        except Exception:
+            return
+        pending_events.popleft()
+
+
+async def flush_pending_loop():
+    """Фоновая досылка отложенных событий, пока breaker пропускает вызовы"""
+    while True:
+        await asyncio.sleep(settings.kafka_pending_flush_interval_seconds)
+        await _flush_pending()
+
+
+async def drain_pending_events():
+    """
+    Досылка отложенных событий при остановке, не дольше
+    kafka_shutdown_drain_seconds; оставшиеся теряются с записью в лог
+    """
+
+    async def drain():
+        while True:
+            await _flush_pending()
+            if not pending_events:
+                return
+            await asyncio.sleep(settings.kafka_pending_flush_interval_seconds)
+
+    if pending_events:
+        try:
+            await asyncio.wait_for(drain(), settings.kafka_shutdown_drain_seconds)
+        except asyncio.TimeoutError:
+            pass
+    if pending_events:
+        logger.error(
+            f"{len(pending_events)} pending Kafka events lost on shutdown, "
+            f"first: {pending_events[0][0]}"
+        )
+
+
+def retry_headers(
+    attempt: int, delay_seconds: int, error: str, source: dict | None = None
+) -> list:
+    """
+    Заголовки как у consumer: попытка, время, раньше которого не обрабатывать,
+    ошибка и исходные топик, секция и offset сообщения (source из consumer;
+    для задач без source - топик new_order, секция и offset -1)
+    """
+    source = source or {}
+    not_before = int((time.time() + delay_seconds) * 1000)
+    return [
+        ("attempt", str(attempt).encode()),
+        ("not_before", str(not_before).encode()),
+        ("error", error[:1000].encode()),
+        (
+            "original_topic",
+            str(source.get("topic", settings.new_order_topic)).encode(),
+        ),
+        ("original_partition", str(source.get("partition", -1)).encode()),
+        ("original_offset", str(source.get("offset", -1)).encode()),
+    ]
+
+
+class FailurePublisher:
+    """
+    Producer для синхронного кода воркера Celery: один на процесс, работает
+    в собственном event loop в фоновом потоке. Создаётся при первой отправке
+    (уже в дочернем процессе после fork) и переиспользуется следующими задачами.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._producer: AIOKafkaProducer | None = None
+
+    def _run(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(settings.kafka_failure_publish_timeout_seconds)
+        except BaseException:
+            # По таймауту корутина в loop продолжила бы работу
+            future.cancel()
+            raise
+
+    def _ensure_started(self):
+        # После fork поток с loop остался в родителе - начинаем заново
+        if self._producer is not None and self._pid == os.getpid():
+            return
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._loop.run_forever, name="kafka-failure-publisher", daemon=True
+        ).start()
+        self._pid = os.getpid()
+        try:
+            self._producer = self._run(_start_new_producer())
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    def _stop_loop(self):
+        loop, self._loop, self._producer = self._loop, None, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+    def send(self, topic: str, value, key, headers: list):
+        with self._lock:
+            self._ensure_started()
+            self._run(
+                self._producer.send_and_wait(topic, value, key=key, headers=headers)
+            )
+
+    def close(self):
+        with self._lock:
+            if self._producer is None or self._pid != os.getpid():
+                return
+            try:
+                self._run(self._producer.stop())
+            except Exception as e:
+                logger.warning(f"Failed to stop failure publisher: {e!r}")
+            finally:
+                self._stop_loop()
+
+
+failure_publisher = FailurePublisher()
+
+
+def publish_failed_order(
+    order_id: str,
+    attempt: int,
+    error: str,
+    dead: bool = False,
+    source: dict | None = None,
+    created_at: str | None = None,
+):
+    """
+    Синхронная отправка упавшего заказа на следующую ступень повторов
+    (attempt - число уже случившихся неудач) или в DLQ, если ступени
+    кончились или сообщение не имеет смысла повторять. Вызывается из Celery.
+    """
+    tiers = settings.new_order_retry_topics
+    if dead or attempt >= len(tiers):
+        topic, delay = settings.new_order_dlq_topic, 0
+    else:
+        topic, delay = tiers[attempt]
+    headers = retry_headers(attempt + 1, delay, error, source)
+    message = {"order_id": order_id}
+    if created_at:
+        message["created_at"] = created_at
+    failure_publisher.send(topic, message, order_id, headers)
+    return topic
@@ -5,4 +5,15 @@ from .config import settings
 
 # Используем отдельную Redis БД (DB 2) для rate limiter,
 # чтобы избежать конфликта с Celery (DB 0) и результатами Celery (DB 1)
-limiter = Limiter(key_func=get_remote_address, storage_uri=settings.redis_limiter_url)
+# При недоступном Redis счётчики временно ведутся в памяти процесса,
+# а короткие таймауты не дают проверке лимита растянуть запрос
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=settings.redis_limiter_url,
+    storage_options={
+        "socket_timeout": settings.redis_socket_timeout_seconds,
+        "socket_connect_timeout": settings.redis_socket_timeout_seconds,
+    },
+    in_memory_fallback_enabled=True,
+    swallow_errors=True,
+)
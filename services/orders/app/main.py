@@ -1,22 +1,47 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from slowapi.errors import RateLimitExceeded
-from sqlalchemy import text
 
-from .database import engine
-from .kafka import producer
+from .concurrency import ConcurrencyLimitMiddleware, concurrency_limiter
+from .events import broadcaster
+from .health import readiness
+from .kafka import (
+    drain_pending_events,
+    ensure_order_topics,
+    flush_pending_loop,
+    pending_events,
+    start_producer,
+    stop_producer,
+)
+from .keys import get_verification_keys
 from .limiter import limiter
+from .profiling import ProfilingMiddleware, require_profiling_token
+from .resilience import breaker_states
 from .routers.orders import router
+from .sql_stats import SQLStatsMiddleware, explain, query_registry
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await producer.start()
+    # Ошибка в настройке ключей JWT - при старте, а не на первом запросе
+    get_verification_keys()
+    await ensure_order_topics()
+    await start_producer()
+    await broadcaster.start()
+    flush_task = asyncio.create_task(flush_pending_loop())
+    await readiness.start()
     yield
-    await producer.stop()
+    await readiness.stop()
+    flush_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await flush_task
+    await drain_pending_events()
+    await broadcaster.stop()
+    await stop_producer()
 
 
 app = FastAPI(title="Orders Service", lifespan=lifespan)
@@ -32,6 +57,11 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PATCH", "OPTIONS"],
     allow_headers=["*"],
 )
+app.add_middleware(SQLStatsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+# Добавлен последним - выполняется первым и отбрасывает лишние запросы
+# до любой другой работы
+app.add_middleware(ConcurrencyLimitMiddleware)
 
 app.state.limiter = limiter
 app.add_exception_handler(
@@ -45,25 +75,43 @@ app.include_router(router, tags=["orders"])
 
 
 @app.get("/health")
-def health():
+@app.get("/health/live")
+async def health():
+    """Liveness: процесс жив и обслуживает event loop, зависимости не проверяются"""
     return {"status": "ok"}
 
 
-@app.get("/health/db")
-def health_db():
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(
-                text(
-                    "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'orders')"
-                )
-            ).scalar()
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: последний результат фоновых проверок, без обращения к зависимостям"""
+    snapshot = readiness.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
+
+
+@app.get("/health/breakers")
+def health_breakers():
+    """Состояние circuit breaker'ов Redis и Kafka"""
+    return {**breaker_states(), "kafka_pending_events": len(pending_events)}
+
 
-            if not result:
-                return {"status": "error", "message": "Orders table not found"}, 503
+@app.get("/health/concurrency")
+def health_concurrency():
+    """Текущий адаптивный лимит, число запросов в работе и отброшенных"""
+    return concurrency_limiter.snapshot()
 
-            conn.execute(text("SELECT 1 FROM orders LIMIT 1"))
 
-            return {"status": "ok", "database": "connected", "orders_table": "exists"}
-    except Exception as e:
-        return {"status": "error", "message": f"Database check failed: {str(e)}"}, 503
+@app.get("/debug/sql", dependencies=[Depends(require_profiling_token)])
+def debug_sql(limit: int = 20):
+    """Самые затратные отпечатки SQL в этом процессе"""
+    return query_registry.top(limit)
+
+
+@app.get(
+    "/debug/sql/{query_id}/explain", dependencies=[Depends(require_profiling_token)]
+)
+def debug_sql_explain(query_id: str):
+    """Обобщённый план отпечатка и типы параметров последнего медленного выполнения"""
+    sample = explain(query_id)
+    if sample is None:
+        raise HTTPException(status_code=404, detail="No slow sample for this query")
+    return {"query_id": query_id, **sample}
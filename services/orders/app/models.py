@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime, timezone
 from enum import Enum as PyEnum
 
-from sqlalchemy import JSON, Column, DateTime, Enum, Float, Integer
+from sqlalchemy import JSON, Column, DateTime, Enum, Float, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
 
 from .database import Base
@@ -17,8 +17,15 @@ class OrderStatus(PyEnum):
 
 class Order(Base):
     __tablename__ = "orders"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
-    user_id = Column(Integer, index=True, nullable=False)
+    # Таблица секционирована по месяцам (RANGE по created_at), поэтому
+    # ключ секционирования обязан входить в первичный ключ
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Integer, nullable=False)
     items = Column(JSON, nullable=False)
     total_price = Column(Float, nullable=False)
     status = Column(
@@ -26,6 +33,57 @@ class Order(Base):
         default=OrderStatus.PENDING,
         nullable=False,
     )
+    # Растёт при каждом изменении заказа, основа ETag
+    version = Column(Integer, default=1, nullable=False)
     created_at = Column(
-        DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+        DateTime(timezone=True),
+        primary_key=True,
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+
+
+# Допустимые переходы: статус -> в какие статусы из него можно перейти
+STATUS_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.PAID, OrderStatus.CANCELED},
+    OrderStatus.PAID: {OrderStatus.SHIPPED, OrderStatus.CANCELED},
+    OrderStatus.SHIPPED: set(),
+    OrderStatus.CANCELED: set(),
+}
+
+
+def allowed_from(status: OrderStatus) -> list[OrderStatus]:
+    """Статусы, из которых разрешён переход в status"""
+    return [old for old, targets in STATUS_TRANSITIONS.items() if status in targets]
+
+
+# Колонка счётчика в user_order_stats для каждого статуса
+STATUS_COUNT_COLUMNS = {
+    OrderStatus.PENDING: "pending_count",
+    OrderStatus.PAID: "paid_count",
+    OrderStatus.SHIPPED: "shipped_count",
+    OrderStatus.CANCELED: "canceled_count",
+}
+
+
+class UserOrderStats(Base):
+    """
+    Сводка по заказам пользователя. Обновляется инкрементально в той же
+    транзакции, что и изменение заказа (см. crud.py).
+    total_spent - сумма заказов, кроме отменённых.
+    """
+
+    __tablename__ = "user_order_stats"
+    user_id = Column(Integer, primary_key=True)
+    order_count = Column(Integer, default=0, nullable=False)
+    total_spent = Column(Float, default=0, nullable=False)
+    pending_count = Column(Integer, default=0, nullable=False)
+    paid_count = Column(Integer, default=0, nullable=False)
+    shipped_count = Column(Integer, default=0, nullable=False)
+    canceled_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        nullable=False,
     )
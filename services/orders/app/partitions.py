@@ -0,0 +1,172 @@
+"""
+Обслуживание месячных секций таблицы orders.
+
+Запуск вручную:
+    python -m app.partitions            # создать будущие и отсоединить старые секции
+    python -m app.partitions --dry-run  # только показать, что будет сделано
+"""
+
+import argparse
+import logging
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .config import settings
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "orders"
+PARTITION_NAME_RE = re.compile(r"^orders_p(\d{4})_(\d{2})$")
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    month_index = value.year * 12 + (value.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def create_partition(conn: Connection, month: date) -> str:
+    """Создаёт секцию за месяц, если её ещё нет"""
+    name = partition_name(month)
+    lower = month_start(month)
+    upper = add_months(lower, 1)
+    conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{lower.isoformat()} 00:00:00+00') "
+            f"TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+    )
+    return name
+
+
+def list_partitions(conn: Connection, detach_pending: bool = False) -> list[str]:
+    rows = conn.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :parent
+              AND pg_inherits.inhdetachpending = :detach_pending
+            """
+        ),
+        {"parent": PARENT_TABLE, "detach_pending": detach_pending},
+    )
+    return [row[0] for row in rows]
+
+
+def ensure_future_partitions(
+    conn: Connection, months_ahead: int, today: date | None = None
+) -> list[str]:
+    """Заранее создаёт секции на текущий и months_ahead следующих месяцев"""
+    current = month_start(today or datetime.now(timezone.utc).date())
+    return [
+        create_partition(conn, add_months(current, offset))
+        for offset in range(months_ahead + 1)
+    ]
+
+
+def find_expired_partitions(
+    partitions: list[str], retention_months: int, today: date | None = None
+) -> list[str]:
+    """Секции, все строки которых старше окна хранения"""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(
+        month_start(today or datetime.now(timezone.utc).date()), -retention_months
+    )
+    expired = []
+    for name in partitions:
+        match = PARTITION_NAME_RE.match(name)
+        if not match:
+            # посторонние таблицы не трогаем
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if add_months(month, 1) <= cutoff:
+            expired.append(name)
+    return sorted(expired)
+
+
+def detach_partition(conn: Connection, name: str, finalize: bool = False) -> None:
+    """
+    CONCURRENTLY: на orders берётся SHARE UPDATE EXCLUSIVE вместо ACCESS
+    EXCLUSIVE, чтение и запись заказов не останавливаются. Выполняется вне
+    транзакции (conn в режиме AUTOCOMMIT). Прерванное отсоединение остаётся
+    в состоянии detach pending и завершается через FINALIZE.
+    Секция остаётся обычной таблицей: её можно выгрузить в архив или удалить.
+    """
+    mode = "FINALIZE" if finalize else "CONCURRENTLY"
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name} {mode}"))
+
+
+def maintain_partitions(
+    months_ahead: int | None = None,
+    retention_months: int | None = None,
+    dry_run: bool = False,
+) -> dict:
+    if months_ahead is None:
+        months_ahead = settings.partition_premake_months
+    if retention_months is None:
+        retention_months = settings.partition_retention_months
+
+    with engine.begin() as conn:
+        existing = set(list_partitions(conn))
+        pending = list_partitions(conn, detach_pending=True)
+        current = month_start(datetime.now(timezone.utc).date())
+        wanted = [
+            partition_name(add_months(current, offset))
+            for offset in range(months_ahead + 1)
+        ]
+        created = [name for name in wanted if name not in existing]
+        expired = find_expired_partitions(sorted(existing), retention_months)
+
+        if not dry_run:
+            ensure_future_partitions(conn, months_ahead)
+
+    if not dry_run and (pending or expired):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for name in pending:
+                detach_partition(conn, name, finalize=True)
+            for name in expired:
+                detach_partition(conn, name)
+
+    for name in created:
+        logger.info(f"Partition {name} created")
+    for name in pending:
+        logger.info(f"Partition {name} detach finalized")
+    for name in expired:
+        logger.info(f"Partition {name} detached")
+    return {"created": created, "detached": pending + expired, "dry_run": dry_run}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain monthly orders partitions")
+    parser.add_argument("--months-ahead", type=int, default=None)
+    parser.add_argument("--retention-months", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = maintain_partitions(
+        months_ahead=args.months_ahead,
+        retention_months=args.retention_months,
+        dry_run=args.dry_run,
+    )
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
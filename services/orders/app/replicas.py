@@ -0,0 +1,54 @@
+"""
+Маршрутизация чтений между primary и репликами (read-your-writes).
+
+После записи пользователь помечается в Redis на replica_read_your_writes_seconds:
+пока метка жива, его чтения идут в primary, иначе - в случайную реплику.
+"""
+
+import logging
+import random
+
+from .cache import redis_client
+from .config import settings
+from .database import ReplicaSessionLocals, SessionLocal
+from .resilience import redis_breaker
+
+logger = logging.getLogger(__name__)
+
+
+def recent_write_key(user_id: int) -> str:
+    return f"recent_write:{user_id}"
+
+
+def mark_recent_write(user_id: int):
+    """Помечает, что пользователь только что писал: его чтения пойдут в primary"""
+    if not ReplicaSessionLocals:
+        return
+    try:
+        redis_breaker.call(
+            redis_client.setex,
+            recent_write_key(user_id),
+            settings.replica_read_your_writes_seconds,
+            1,
+        )
+    except Exception as e:
+        logger.warning(f"Failed to set recent write marker for user {user_id}: {e}")
+
+
+def has_recent_write(user_id: int) -> bool:
+    try:
+        return bool(redis_breaker.call(redis_client.exists, recent_write_key(user_id)))
+    except Exception as e:
+        # Не знаем, отстаёт ли реплика - безопаснее читать из primary
+        logger.warning(f"Failed to check recent write marker for user {user_id}: {e}")
+        return True
+
+
+def read_session_factory(user_id: int):
+    """
+    Фабрика сессий для чтения: случайная реплика из пула.
+    Если реплик нет или пользователь недавно писал - primary.
+    """
+    if not ReplicaSessionLocals or has_recent_write(user_id):
+        return SessionLocal
+    return random.choice(ReplicaSessionLocals)
@@ -0,0 +1,151 @@
+"""
+Circuit breaker для внешних зависимостей на пути запроса (Redis, Kafka).
+
+closed    - вызовы идут как обычно, подряд идущие ошибки считаются;
+open      - после breaker_failure_threshold ошибок вызовы не выполняются
+            вовсе (CircuitOpenError), вызывающий сразу применяет запасной путь;
+half_open - через breaker_recovery_seconds пропускается один пробный вызов:
+            успех закрывает breaker, ошибка снова открывает.
+
+Вместе с короткими таймаутами клиентов это ограничивает задержку запроса,
+когда зависимость деградировала.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from .config import settings
+from .profiling import timed
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker '{name}' is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int | None = None,
+        recovery_seconds: float | None = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.breaker_failure_threshold
+        self.recovery_seconds = recovery_seconds or settings.breaker_recovery_seconds
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        # Вызовы идут и из event loop, и из потоков (Celery, threadpool)
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if (
+                self._state == OPEN
+                and time.monotonic() - self._opened_at >= self.recovery_seconds
+            ):
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_seconds:
+                    return False
+                self._state = HALF_OPEN
+            # half_open: только один пробный вызов одновременно
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        # Вызов отменён (CancelledError): ни успех, ни ошибка, но пробный
+        # вызов half_open должен освободиться, иначе breaker не закроется
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(
+                        f"Circuit breaker '{self.name}' opened "
+                        f"after {self._failures} failures"
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        """Синхронный вызов через breaker; ошибки пробрасываются вызывающему"""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            with timed(self.name):
+                result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, func, *args, timeout: float, **kwargs):
+        """Асинхронный вызов с таймаутом; таймаут считается ошибкой"""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            with timed(self.name):
+                result = await asyncio.wait_for(func(*args, **kwargs), timeout)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_seconds": self.recovery_seconds,
+        }
+
+
+redis_breaker = CircuitBreaker("redis")
+kafka_breaker = CircuitBreaker("kafka")
+
+
+def breaker_states() -> dict:
+    return {
+        breaker.name: breaker.snapshot() for breaker in (redis_breaker, kafka_breaker)
+    }
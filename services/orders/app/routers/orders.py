@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+import asyncio
+import json
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
 
-from .. import crud, schemas
-from ..cache import get_cache, set_cache
+from .. import crud, idempotency, models, schemas
+from ..archive import find_archived_order
+from ..cache import cache_order, get_cache, get_order_meta
+from ..config import settings
 from ..database import get_db
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, get_read_db
+from ..etag import etag_matches, order_etag, user_orders_etag
+from ..events import broadcaster, publish_order_status
+from ..export import MEDIA_TYPES, stream_orders
 from ..kafka import send_new_order
 from ..limiter import limiter
+from ..replicas import mark_recent_write
 
 router = APIRouter()
 
@@ -18,36 +31,87 @@ async def create_order(
     order: schemas.OrderCreate,
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
 ):
-    db_order = crud.create_order(db=db, order=order, user_id=user_id)
-    order_dict = schemas.Order.model_validate(db_order).model_dump()
-    set_cache(f"order:{db_order.id}", order_dict, 300)
-    await send_new_order(db_order.id)
-    return db_order
+    if idempotency_key:
+        request_fingerprint = idempotency.fingerprint(order.model_dump_json())
+        record = idempotency.claim(user_id, idempotency_key, request_fingerprint)
+        if record is not None:
+            return await idempotency.replay(
+                user_id, idempotency_key, request_fingerprint, record
+            )
+
+    try:
+        db_order = crud.create_order(db=db, order=order, user_id=user_id)
+    except Exception:
+        if idempotency_key:
+            idempotency.release(user_id, idempotency_key)
+        raise
+
+    order_schema = schemas.Order.model_validate(db_order)
+    body = order_schema.model_dump_json()
+    # Ответ сохраняется сразу после коммита: заказ уже существует,
+    # и повтор не должен создать второй даже при сбое отправки в Kafka
+    if idempotency_key:
+        idempotency.store_response(
+            user_id, idempotency_key, request_fingerprint, 200, body
+        )
+    mark_recent_write(user_id)
+    publish_order_status(db_order)
+    cache_order(order_schema.model_dump())
+    await send_new_order(db_order.id, user_id, db_order.created_at)
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/orders/{order_id}/", response_model=schemas.Order)
 @limiter.limit("10/minute")
 async def read_order(
     request: Request,
+    response: Response,
     order_id: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user_id: int = Depends(get_current_user),
 ):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # Быстрый путь: по метаданным из Redis отвечаем 304 без тела заказа
+        meta = get_order_meta(order_id)
+        if meta:
+            owner_id, version = meta
+            if owner_id != user_id:
+                raise HTTPException(status_code=403, detail="Not authorized")
+            etag = order_etag(order_id, version)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+
     cached = get_cache(f"order:{order_id}")
-    if cached:
+    if cached and "version" in cached:
         if cached["user_id"] != user_id:
             raise HTTPException(status_code=403, detail="Not authorized")
+        response.headers["ETag"] = order_etag(order_id, cached["version"])
         return cached
 
     db_order = crud.get_order(db, order_id)
     if not db_order:
-        raise HTTPException(status_code=404, detail="Order not found")
+        # Завершённые старые заказы лежат в Parquet-архиве
+        archived = await asyncio.to_thread(find_archived_order, order_id)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if archived["user_id"] != user_id:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        etag = order_etag(order_id, archived["version"])
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return archived
     if db_order.user_id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    order_dict = schemas.Order.model_validate(db_order).model_dump()
-    set_cache(f"order:{order_id}", order_dict, 300)
+    cache_order(schemas.Order.model_validate(db_order).model_dump())
+    etag = order_etag(order_id, db_order.version)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return db_order
 
 
@@ -60,13 +124,23 @@ async def update_order_status(
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user),
 ):
-    db_order = crud.get_order(db, order_id)
-    if not db_order or db_order.user_id != user_id:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    updated = crud.update_order_status(db, order_id, update.status, user_id=user_id)
+    if updated is None:
+        # Разбор причины отказа - только на неуспешном пути
+        db_order = crud.get_order(db, order_id)
+        if not db_order or db_order.user_id != user_id:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                f"Status transition {db_order.status.value} -> "
+                f"{update.status.value} is not allowed"
+            ),
+        )
 
-    updated = crud.update_order_status(db, order_id, update.status)
-    order_dict = schemas.Order.model_validate(updated).model_dump()
-    set_cache(f"order:{order_id}", order_dict, 300)
+    mark_recent_write(user_id)
+    publish_order_status(updated)
+    cache_order(schemas.Order.model_validate(updated).model_dump())
     return updated
 
 
@@ -74,10 +148,100 @@ async def update_order_status(
 @limiter.limit("10/minute")
 async def read_user_orders(
     request: Request,
+    response: Response,
     user_id: int,
-    db: Session = Depends(get_db),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+    current_user_id: int = Depends(get_current_user),
+):
+    if user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    # Версия списка - строка сводки: одна точечная выборка вместо всех заказов
+    stats = crud.get_user_order_stats(db, user_id)
+    if stats is not None:
+        etag = user_orders_etag(user_id, stats, created_from, created_to)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+    return crud.get_orders_by_user(
+        db, user_id, created_from=created_from, created_to=created_to
+    )
+
+
+@router.get("/orders/user/{user_id}/export")
+@limiter.limit("10/minute")
+async def export_user_orders(
+    request: Request,
+    user_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     current_user_id: int = Depends(get_current_user),
 ):
+    """Полная история заказов потоком, без загрузки всех строк в память"""
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    return crud.get_orders_by_user(db, user_id)
+    filename = f"orders_{user_id}.{format}"
+    stream = stream_orders(user_id, format, created_from, created_to)
+    return StreamingResponse(
+        stream,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        # Выполняется и после обрыва соединения: закрывает курсор и сессию
+        background=BackgroundTask(stream.close),
+    )
+
+
+@router.get("/orders/user/{user_id}/stats", response_model=schemas.UserOrderStats)
+@limiter.limit("10/minute")
+async def read_user_order_stats(
+    request: Request,
+    user_id: int,
+    db: Session = Depends(get_read_db),
+    current_user_id: int = Depends(get_current_user),
+):
+    if user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    stats = crud.get_user_order_stats(db, user_id)
+    return {
+        "user_id": user_id,
+        "order_count": stats.order_count if stats else 0,
+        "total_spent": stats.total_spent if stats else 0,
+        "count_by_status": {
+            status: getattr(stats, column) if stats else 0
+            for status, column in models.STATUS_COUNT_COLUMNS.items()
+        },
+    }
+
+
+@router.get("/orders/user/{user_id}/events")
+@limiter.limit("10/minute")
+async def stream_user_order_events(
+    request: Request,
+    user_id: int,
+    current_user_id: int = Depends(get_current_user),
+):
+    """Server-Sent Events: поток смен статуса заказов пользователя"""
+    if user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    async def event_stream():
+        async with broadcaster.subscribe(user_id) as queue:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.sse_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    # Комментарий-heartbeat держит соединение через прокси
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: order_status\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -18,6 +18,7 @@ class Order(BaseModel):
     items: List[Dict]
     total_price: float
     status: OrderStatus
+    version: int = 1
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
@@ -25,3 +26,10 @@ class Order(BaseModel):
 
 class OrderUpdate(BaseModel):
     status: OrderStatus
+
+
+class UserOrderStats(BaseModel):
+    user_id: int
+    order_count: int = 0
+    total_spent: float = 0
+    count_by_status: Dict[OrderStatus, int]
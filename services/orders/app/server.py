@@ -0,0 +1,11 @@
+"""
+Воркер gunicorn для многопроцессного режима (см. gunicorn.conf.py).
+"""
+
+from uvicorn.workers import UvicornWorker
+
+
+class UvloopWorker(UvicornWorker):
+    """uvloop и httptools явно, без тихого отката на asyncio и h11"""
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
@@ -0,0 +1,250 @@
+"""
+Инструментирование SQL через события engine (before/after_cursor_execute).
+
+Каждый оператор сводится к отпечатку: литералы и параметры заменяются на ?,
+списки IN (...) схлопываются. По отпечаткам считаются:
+- число и время операторов в рамках HTTP-запроса (db в Server-Timing);
+- медленные операторы (дольше sql_slow_query_ms) - предупреждение в лог;
+  от последнего медленного выполнения хранятся текст оператора и типы
+  параметров (значения - email, хеши токенов - не сохраняются), план строится
+  по требованию EXPLAIN (GENERIC_PLAN) (/debug/sql/{query_id}/explain);
+- повторы: один отпечаток sql_repeated_query_threshold и более раз за
+  запрос (N+1, повторная выборка той же строки) - предупреждение в лог.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+
+from sqlalchemy import event
+
+from .config import settings
+from .profiling import add_timing
+
+logger = logging.getLogger(__name__)
+
+_NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|\$\d+"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> tuple[str, str]:
+    """
+    (query_id, нормализованный текст). Тексты операторов повторяются из-за
+    кеша компиляции SQLAlchemy, поэтому нормализация кешируется.
+    """
+    text = statement
+    for pattern, replacement in _NORMALIZE:
+        text = pattern.sub(replacement, text)
+    text = text.strip()
+    return hashlib.sha1(text.encode()).hexdigest()[:12], text
+
+
+def parameter_types(parameters) -> dict | list:
+    """Типы параметров вместо значений: образец не хранит данные пользователей"""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+@dataclass
+class QueryStat:
+    text: str
+    count: int = 0
+    duration: float = 0.0
+    max_duration: float = 0.0
+    slow_count: int = 0
+    repeated_requests: int = 0
+    last_repeated_in: str | None = None
+    # (engine, statement, типы параметров) последнего медленного выполнения
+    sample: tuple | None = None
+
+    def add(self, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.max_duration = max(self.max_duration, duration)
+
+
+class QueryRegistry:
+    """Накопленная статистика отпечатков в процессе (ограничена по размеру)"""
+
+    def __init__(self, max_size: int):
+        self._stats: dict[str, QueryStat] = {}
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def record(self, query_id: str, text: str, duration: float, sample=None):
+        with self._lock:
+            stat = self._stats.get(query_id)
+            if stat is None:
+                if len(self._stats) >= self._max_size:
+                    return
+                stat = self._stats[query_id] = QueryStat(text)
+            stat.add(duration)
+            if sample is not None:
+                stat.slow_count += 1
+                stat.sample = sample
+
+    def mark_repeated(self, query_id: str, route: str):
+        with self._lock:
+            stat = self._stats.get(query_id)
+            if stat is not None:
+                stat.repeated_requests += 1
+                stat.last_repeated_in = route
+
+    def sample(self, query_id: str):
+        with self._lock:
+            stat = self._stats.get(query_id)
+            return stat.sample if stat is not None else None
+
+    def top(self, limit: int) -> list[dict]:
+        with self._lock:
+            items = sorted(
+                self._stats.items(), key=lambda item: item[1].duration, reverse=True
+            )[:limit]
+            return [
+                {
+                    "query_id": query_id,
+                    "count": stat.count,
+                    "total_ms": round(stat.duration * 1000, 2),
+                    "avg_ms": round(stat.duration * 1000 / stat.count, 2),
+                    "max_ms": round(stat.max_duration * 1000, 2),
+                    "slow_count": stat.slow_count,
+                    "repeated_requests": stat.repeated_requests,
+                    "last_repeated_in": stat.last_repeated_in,
+                    "explainable": stat.sample is not None,
+                    "query": stat.text,
+                }
+                for query_id, stat in items
+            ]
+
+
+query_registry = QueryRegistry(settings.sql_stats_max_queries)
+
+_request_queries: ContextVar[dict | None] = ContextVar("request_queries", default=None)
+
+
+def record_query(engine, statement: str, parameters, duration: float, executemany):
+    if statement.lstrip()[:7].upper() == "EXPLAIN":
+        return
+    query_id, text = fingerprint(statement)
+    slow = duration * 1000 >= settings.sql_slow_query_ms
+    sample = None
+    if slow:
+        logger.warning(f"Slow query {query_id} ({duration * 1000:.1f} ms): {text}")
+        # executemany не объяснить одним EXPLAIN
+        if not executemany:
+            sample = (engine, statement, parameter_types(parameters))
+    query_registry.record(query_id, text, duration, sample)
+
+    queries = _request_queries.get()
+    if queries is not None:
+        stat = queries.get(query_id)
+        if stat is None:
+            stat = queries[query_id] = QueryStat(text)
+        stat.add(duration)
+
+
+def instrument_engine(engine):
+    """Подписка на события курсора: Server-Timing (db) и статистика SQL"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_started"].pop()
+        add_timing("db", duration)
+        record_query(conn.engine, statement, parameters, duration, executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute не вызывается при ошибке - снимаем отметку сами
+        conn = context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+def report_request(scope, queries: dict):
+    route = getattr(scope.get("route"), "path", scope["path"])
+    name = f"{scope['method']} {route}"
+    threshold = settings.sql_repeated_query_threshold
+    for query_id, stat in queries.items():
+        if threshold and stat.count >= threshold:
+            query_registry.mark_repeated(query_id, name)
+            logger.warning(
+                f"Repeated query in {name}: {query_id} x{stat.count} "
+                f"({stat.duration * 1000:.1f} ms): {stat.text}"
+            )
+    if logger.isEnabledFor(logging.DEBUG):
+        total = sum(stat.duration for stat in queries.values())
+        count = sum(stat.count for stat in queries.values())
+        logger.debug(
+            f"SQL in {name}: {count} statements, {len(queries)} distinct, "
+            f"{total * 1000:.1f} ms"
+        )
+
+
+class SQLStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Словарь изменяется на месте: его видят и потоки threadpool,
+        # куда Starlette копирует контекст синхронных эндпоинтов
+        queries: dict[str, QueryStat] = {}
+        token = _request_queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_queries.reset(token)
+            if queries:
+                report_request(scope, queries)
+
+
+_PYFORMAT = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def numbered_placeholders(statement: str) -> str:
+    """%(name)s / %s psycopg2 -> $1, $2...: так параметры понимает GENERIC_PLAN"""
+    numbers: dict = {}
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        # У позиционных %s имени нет - ключом служит позиция в тексте
+        key = match.group(1) or match.start()
+        return f"${numbers.setdefault(key, len(numbers) + 1)}"
+
+    return _PYFORMAT.sub(replace, statement)
+
+
+def explain(query_id: str) -> dict | None:
+    """
+    EXPLAIN (GENERIC_PLAN) последнего медленного образца на отдельном
+    соединении: план без значений параметров, оператор не выполняется
+    (PostgreSQL 16+). None - образца нет.
+    """
+    sample = query_registry.sample(query_id)
+    if sample is None:
+        return None
+    engine, statement, types = sample
+    with engine.connect() as conn:
+        result = conn.execution_options(no_parameters=True).exec_driver_sql(
+            f"EXPLAIN (GENERIC_PLAN) {numbered_placeholders(statement)}"
+        )
+        return {"parameter_types": types, "plan": [row[0] for row in result]}
@@ -0,0 +1,72 @@
+"""
+Разовое заполнение user_order_stats по существующим заказам.
+
+Запуск вручную:
+    python -m app.stats backfill
+    python -m app.stats backfill --user-id 42
+
+Пересчёт идемпотентен. Запускать лучше без потока записи: заказ, созданный
+во время пересчёта, может быть учтён дважды.
+"""
+
+import argparse
+import logging
+
+from sqlalchemy import text
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_SQL = """
+    INSERT INTO user_order_stats (
+        user_id, order_count, total_spent,
+        pending_count, paid_count, shipped_count, canceled_count, updated_at
+    )
+    SELECT
+        user_id,
+        count(*),
+        coalesce(sum(total_price) FILTER (WHERE status <> 'CANCELED'), 0),
+        count(*) FILTER (WHERE status = 'PENDING'),
+        count(*) FILTER (WHERE status = 'PAID'),
+        count(*) FILTER (WHERE status = 'SHIPPED'),
+        count(*) FILTER (WHERE status = 'CANCELED'),
+        now()
+    FROM orders
+    {where}
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        order_count = excluded.order_count,
+        total_spent = excluded.total_spent,
+        pending_count = excluded.pending_count,
+        paid_count = excluded.paid_count,
+        shipped_count = excluded.shipped_count,
+        canceled_count = excluded.canceled_count,
+        updated_at = excluded.updated_at
+"""
+
+
+def backfill(user_id: int | None = None) -> int:
+    where = "WHERE user_id = :user_id" if user_id is not None else ""
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(BACKFILL_SQL.format(where=where)), {"user_id": user_id}
+        )
+    logger.info(f"User order stats backfilled: users={result.rowcount}")
+    return result.rowcount
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="User order stats maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill")
+    backfill_parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "backfill":
+        print(f"Users updated: {backfill(user_id=args.user_id)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import logging
 import time
 import uuid
+from datetime import datetime
 
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_shutdown, worker_shutdown
 
 from .config import settings
 
@@ -14,19 +17,57 @@ celery = Celery(
     backend=settings.celery_result_backend,
 )
 
+celery.conf.beat_schedule = {
+    # Раз в сутки создаём будущие секции orders и отсоединяем устаревшие
+    "maintain-order-partitions": {
+        "task": "app.tasks.maintain_order_partitions",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "archive-finished-orders": {
+        "task": "app.tasks.archive_finished_orders",
+        "schedule": crontab(hour=4, minute=0),
+    },
+}
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_failure_publisher(**kwargs):
+    # Producer повторов живёт весь процесс воркера - закрываем при остановке
+    from .kafka import failure_publisher
+
+    failure_publisher.close()
+
 
 @celery.task(bind=True, max_retries=3)
-def process_order(self, order_id: str):
+def process_order(
+    self,
+    order_id: str,
+    attempt: int = 0,
+    source: dict | None = None,
+    created_at: str | None = None,
+):
     """
     Обработка заказа:
     1. Имитация обработки платежа
     2. Обновление статуса в БД на PAID
 
+    Упавший заказ не ждёт повтора в воркере Celery, а уходит на следующую
+    ступень топиков повторов Kafka (new_order.retry.*) или в new_order.dlq.
+
     Args:
         order_id: ID заказа для обработки
+        attempt: сколько раз обработка этого заказа уже падала
+        source: исходные топик, секция и offset сообщения Kafka
+            (для заголовков original_* на ступенях повторов)
+        created_at: дата создания заказа (ISO 8601) из события new_order -
+            UPDATE и SELECT читают одну секцию orders вместо всех
     """
-    from . import crud, models
+    from . import crud, models, schemas
     from .database import SessionLocal
+    from .cache import cache_order
+    from .events import publish_order_status
+    from .kafka import publish_failed_order
 
     db = SessionLocal()
     try:
@@ -40,27 +81,98 @@ def process_order(self, order_id: str):
             order_uuid = uuid.UUID(order_id)
         except ValueError:
             logger.error(f"Invalid order_id format: {order_id}")
-            raise Exception(f"Invalid order_id format: {order_id}")
+            # Повтор не поможет - сразу в DLQ
+            publish_failed_order(
+                order_id,
+                attempt,
+                "Invalid order_id format",
+                dead=True,
+                source=source,
+                created_at=created_at,
+            )
+            return {"order_id": order_id, "message": "Invalid order_id format"}
 
-        # Обновляем статус заказа на PAID в БД
+        try:
+            order_created_at = (
+                datetime.fromisoformat(created_at) if created_at else None
+            )
+        except ValueError:
+            order_created_at = None
+
+        # Условный переход PENDING -> PAID одним UPDATE
         updated_order = crud.update_order_status(
-            db, order_uuid, models.OrderStatus.PAID
+            db, order_uuid, models.OrderStatus.PAID, created_at=order_created_at
         )
 
         if updated_order:
             logger.info(f"Order {order_id} successfully updated to PAID status")
+            publish_order_status(updated_order)
+            try:
+                # Иначе GET отдаёт из кеша PENDING со старым ETag
+                cache_order(schemas.Order.model_validate(updated_order).model_dump())
+            except Exception as e:
+                logger.warning(f"Failed to refresh cache for order {order_id}: {e}")
             return {
                 "order_id": str(updated_order.id),
                 "status": updated_order.status.value,
                 "message": "Order processed successfully",
             }
-        else:
+
+        db_order = crud.get_order(db, order_uuid, created_at=order_created_at)
+        if db_order is None:
             logger.error(f"Order {order_id} not found in database")
             raise Exception(f"Order {order_id} not found in database")
 
+        # Повторная доставка или заказ уже отменён - повторять бессмысленно
+        logger.warning(
+            f"Order {order_id} skipped: transition "
+            f"{db_order.status.value} -> PAID is not allowed"
+        )
+        return {
+            "order_id": order_id,
+            "status": db_order.status.value,
+            "message": "Status transition not allowed",
+        }
+
     except Exception as e:
         logger.error(f"Error processing order {order_id}: {str(e)}")
-        # Retry с exponential backoff (2^retries seconds)
-        raise self.retry(exc=e, countdown=2**self.request.retries)
+        try:
+            topic = publish_failed_order(
+                order_id, attempt, str(e), source=source, created_at=created_at
+            )
+        except Exception as publish_error:
+            logger.error(
+                f"Failed to publish order {order_id} for retry: {publish_error}"
+            )
+            # Kafka недоступна - остаётся повтор внутри Celery
+            # с exponential backoff (2^retries seconds)
+            raise self.retry(exc=e, countdown=2**self.request.retries)
+        logger.info(f"Order {order_id} sent to {topic}, attempt={attempt + 1}")
+        return {"order_id": order_id, "message": f"Sent to {topic}"}
     finally:
         db.close()
+
+
+@celery.task
+def maintain_order_partitions():
+    """Создание будущих и отсоединение старых месячных секций orders"""
+    from .partitions import maintain_partitions
+
+    result = maintain_partitions()
+    logger.info(
+        f"Partitions maintained: created={result['created']}, "
+        f"detached={result['detached']}"
+    )
+    return result
+
+
+@celery.task
+def archive_finished_orders():
+    """Перенос старых SHIPPED / CANCELED заказов в Parquet-архив"""
+    from .archive import archive_orders
+
+    result = archive_orders()
+    logger.info(
+        f"Orders archived: archived={result['archived']}, files={result['files']}"
+    )
+    return result
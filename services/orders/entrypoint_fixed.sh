@@ -38,10 +38,6 @@ try:
         )
     ''')
     
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS ix_orders_user_id ON orders(user_id)
-    ''')
-    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS alembic_version (
             version_num VARCHAR(50) PRIMARY KEY
@@ -63,6 +59,20 @@ except Exception as e:
     sys.exit(1)
 "
 
+echo "Applying database migrations..."
+cd /app/alembic
+# Схемой владеет Alembic: на старой схеме (без version, user_order_stats,
+# секций) приложение ломалось бы только на запросах
+if ! alembic upgrade head; then
+    echo "Migration failed, exiting"
+    exit 1
+fi
+
 echo "Starting FastAPI..."
 cd /app
+# SERVER_MODE=gunicorn - несколько процессов (WEB_CONCURRENCY, по умолчанию
+# по числу CPU), иначе один процесс uvicorn
+if [ "${SERVER_MODE}" = "gunicorn" ]; then
+    exec gunicorn -c gunicorn.conf.py app.main:app
+fi
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+Многопроцессный режим: gunicorn управляет воркерами uvicorn.
+
+Приложение импортируется один раз в мастере (preload_app), ключи JWT
+разбираются до fork и достаются воркерам копией страниц памяти. Соединения
+(БД, Redis, Kafka producer, подписка SSE) открываются в lifespan каждого воркера:
+в мастере нет event loop, поэтому импорт app.main не должен создавать объекты,
+привязанные к loop (AIOKafkaProducer создаёт start_producer).
+
+    gunicorn -c gunicorn.conf.py app.main:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Async-воркер загружает ядро целиком, поэтому по одному на CPU
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "app.server.UvloopWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = "-"
+
+
+def when_ready(server):
+    from app.keys import get_verification_keys
+
+    get_verification_keys()
+    server.log.info(f"Verification keys preloaded, workers={workers}")
+
+
+def post_fork(server, worker):
+    # Соединения пула, открытые в мастере, не должны использоваться
+    # несколькими процессами сразу
+    from app.database import engine, replica_engines
+
+    for db_engine in [engine, *replica_engines]:
+        db_engine.dispose(close=False)